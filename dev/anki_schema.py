@@ -0,0 +1,86 @@
+import threading
+
+# AnkiConnect's addNote errors that mean our cached deck/model view is stale
+# ("deck was not found: X", "model was not found: X"). Unknown field names are
+# dropped silently by addNote, so they can only be caught by validate().
+SCHEMA_ERRORS = ("deck was not found:", "model was not found:")
+
+
+def is_schema_error(message: str) -> bool:
+    return any(err in message for err in SCHEMA_ERRORS)
+
+
+class AnkiSchema:
+    """Decks, note types and their fields as reported by AnkiConnect.
+
+    Fetched with a single `multi` request (version, deckNames, modelNames and
+    modelFieldNames for every model we use) and kept until `invalidate()`, so
+    each job can be checked locally before any Cambridge/Gemini/Bing work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.info = None
+
+    def probe(self, anki, models) -> dict:
+        models = list(dict.fromkeys(models))
+        actions = [
+            {"action": "version", "version": 6},
+            {"action": "deckNames", "version": 6},
+            {"action": "modelNames", "version": 6},
+        ] + [{"action": "modelFieldNames", "version": 6, "params": {"modelName": m}} for m in models]
+        results = anki("multi", {"actions": actions})
+
+        def unwrap(res):
+            # inner actions with "version" come back as {"result", "error"}
+            if isinstance(res, dict) and "result" in res and "error" in res:
+                return None if res["error"] else res["result"]
+            return res
+
+        values = [unwrap(res) for res in results]
+        info = {
+            "version": values[0],
+            "decks": set(values[1] or []),
+            "models": set(values[2] or []),
+            "fields": {m: values[3 + i] for i, m in enumerate(models)},
+        }
+        with self._lock:
+            self.info = info
+        return info
+
+    def invalidate(self):
+        with self._lock:
+            self.info = None
+
+    def ensure(self, anki, models) -> dict:
+        with self._lock:
+            info = self.info
+        if info is None or any(m not in info["fields"] for m in models):
+            known = list(info["fields"]) if info else []
+            info = self.probe(anki, known + list(models))
+        return info
+
+    @staticmethod
+    def problems(info, deck: str, model: str, fields) -> list[str]:
+        out = []
+        if deck not in info["decks"]:
+            out.append(f"deck not found in Anki: {deck!r}")
+        if model not in info["models"]:
+            out.append(f"note type not found in Anki: {model!r}")
+        else:
+            model_fields = info["fields"].get(model) or []
+            missing = [f for f in fields if f not in model_fields]
+            if missing:
+                out.append(f"note type {model!r} has no field(s) {missing}; it has {model_fields}")
+        return out
+
+    def validate(self, anki, deck: str, model: str, fields) -> list[str]:
+        """Problems that would make addNote fail, re-probing once before
+        reporting so decks/models created after startup are picked up."""
+        info = self.ensure(anki, [model])
+        problems = self.problems(info, deck, model, fields)
+        if problems:
+            # keep the other workflows' models in the refreshed cache
+            info = self.probe(anki, list(info["fields"]) + [model])
+            problems = self.problems(info, deck, model, fields)
+        return problems
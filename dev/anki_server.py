@@ -0,0 +1,330 @@
+"""Headless entry point: run the vocab / IELTS pipelines over local HTTP or CLI.
+
+    python anki_server.py serve
+    python anki_server.py vocab "ubiquitous"
+    python anki_server.py phrase --task 2 "Some people <argue> that ..."
+
+HTTP (bound to SERVER_HOST:SERVER_PORT, default 127.0.0.1:8766):
+
+    POST /vocab              body: {"text": "..."} or plain text
+    POST /phrase?task=1|2    body: {"text": "..."} or plain text
+    GET  /jobs/<id>          job status + timing
+    GET  /health
+
+POST waits for the job by default (up to SERVER_WAIT_TIMEOUT seconds);
+add `?wait=0` to get 202 + job id immediately. When SERVER_MAX_PENDING jobs
+are already queued/running the server answers 503 with Retry-After.
+
+Requests must carry a local Host header (DNS rebinding), browser requests
+need an Origin listed in SERVER_ALLOWED_ORIGINS and a JSON body, and when
+SERVER_TOKEN is set every request needs it in the X-Auto-Anki-Token header.
+"""
+import argparse
+import hmac
+import importlib
+import itertools
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import vocab_anki
+from config_store import parse_config
+from profiling import profile_job
+
+log = vocab_anki.log
+log_exception = vocab_anki.log_exception
+
+config = parse_config(vocab_anki.CONFIG_FILE.read_text(encoding="utf-8"))
+SERVER_HOST = config.get("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(config.get("SERVER_PORT", "8766"))
+SERVER_WORKERS = int(config.get("SERVER_WORKERS", "4"))
+SERVER_MAX_PENDING = int(config.get("SERVER_MAX_PENDING", "16"))
+SERVER_WAIT_TIMEOUT = float(config.get("SERVER_WAIT_TIMEOUT", "120"))
+SERVER_TOKEN = config.get("SERVER_TOKEN", "")
+SERVER_ALLOWED_ORIGINS = {o.strip() for o in config.get("SERVER_ALLOWED_ORIGINS", "").split(",") if o.strip()}
+JOB_HISTORY = 1000
+
+
+def run_vocab(text: str) -> str:
+    cfg = vocab_anki.refresh_config()
+    with profile_job(f"vocab_{text}", cfg["PROFILE_DIR"], cfg["PROFILE"], log):
+        return vocab_anki.create_vocab_card(text, cfg)
+
+
+def phrase_module():
+    """Import phrase_anki on first use. It refuses to load without
+    GEMINI_API_KEY, which must not stop a vocab-only server; the import is
+    retried on the next IELTS job, so fixing the config needs no restart."""
+    try:
+        return importlib.import_module("phrase_anki")
+    except ValueError as e:
+        raise RuntimeError(f"IELTS workflow unavailable: {e}") from e
+
+
+def run_phrase(text: str, task: int) -> str:
+    phrase_anki = phrase_module()
+    cfg = phrase_anki.refresh_config()
+    with profile_job(f"ielts_task{task}_{text}", cfg["PROFILE_DIR"], cfg["PROFILE"], log):
+        return phrase_anki.create_sentence_card(text, task, cfg)
+
+
+class JobQueue:
+    """Bounded worker pool. `submit()` returns None when the pool is saturated
+    so callers can push back instead of queueing without limit."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self.max_pending = max_pending
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j["status"] in ("queued", "running"))
+
+    def submit(self, kind: str, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            return None
+        job = {
+            "id": str(next(self._ids)),
+            "kind": kind,
+            "input": args[0],
+            "status": "queued",
+            "error": None,
+            "queued_at": time.time(),
+            "timing": {},
+            "_done": threading.Event(),
+        }
+        if len(args) > 1:
+            job["task"] = args[1]
+        with self._lock:
+            self._jobs[job["id"]] = job
+            while len(self._jobs) > JOB_HISTORY:
+                self._jobs.popitem(last=False)
+        self._pool.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job, fn, args):
+        started = time.time()
+        job["status"] = "running"
+        try:
+            job["status"] = fn(*args) or "done"
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            log(f"Job {job['id']} failed: {e}", level="ERROR")
+            log_exception(e)
+        finally:
+            finished = time.time()
+            job["timing"] = {
+                "queue_s": round(started - job["queued_at"], 3),
+                "run_s": round(finished - started, 3),
+                "total_s": round(finished - job["queued_at"], 3),
+            }
+            self._slots.release()
+            job["_done"].set()
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+
+def job_view(job) -> dict:
+    return {k: v for k, v in job.items() if not k.startswith("_")}
+
+
+def local_hosts(host: str, port: int) -> set:
+    """Host header values accepted by the server (anything else may be a
+    DNS-rebound page talking to us under its own name)."""
+    names = {"127.0.0.1", "localhost", "[::1]", host.lower()}
+    hosts = {f"{name}:{port}" for name in names}
+    if port == 80:
+        hosts |= names
+    return hosts
+
+
+class Handler(BaseHTTPRequestHandler):
+    jobs: JobQueue = None
+    allowed_hosts: set = set()
+
+    def log_message(self, fmt, *args):
+        log(f"HTTP {self.address_string()} {fmt % args}", level="DEBUG")
+
+    def _from_browser(self) -> bool:
+        return "Origin" in self.headers or "Sec-Fetch-Mode" in self.headers
+
+    def _rejection(self):
+        """(status, reason) when the request must not be served, else None."""
+        if (self.headers.get("Host") or "").lower() not in self.allowed_hosts:
+            return 403, "unexpected Host header"
+        origin = self.headers.get("Origin")
+        if origin is not None and origin not in SERVER_ALLOWED_ORIGINS:
+            return 403, "origin not allowed"
+        if SERVER_TOKEN and not hmac.compare_digest(
+                self.headers.get("X-Auto-Anki-Token", "").encode("utf-8"), SERVER_TOKEN.encode("utf-8")):
+            return 401, "missing or wrong X-Auto-Anki-Token"
+        return None
+
+    def _send(self, status: int, body: dict, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        origin = self.headers.get("Origin")
+        if origin in SERVER_ALLOWED_ORIGINS:
+            self.send_header("Access-Control-Allow-Origin", origin)
+            self.send_header("Vary", "Origin")
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_text(self) -> str:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length).decode("utf-8") if length else ""
+        if "json" in (self.headers.get("Content-Type") or ""):
+            body = json.loads(raw or "{}")
+            if not isinstance(body, dict):
+                raise ValueError("JSON body must be an object")
+            text = body.get("text", "")
+            if not isinstance(text, str):
+                raise ValueError('"text" must be a string')
+            return text
+        return raw
+
+    def do_OPTIONS(self):
+        # CORS preflight, only for allow-listed origins (it never carries the token)
+        if (self.headers.get("Host") or "").lower() not in self.allowed_hosts \
+                or self.headers.get("Origin") not in SERVER_ALLOWED_ORIGINS:
+            return self._send(403, {"error": "origin not allowed"})
+        self.send_response(204)
+        self.send_header("Access-Control-Allow-Origin", self.headers["Origin"])
+        self.send_header("Access-Control-Allow-Methods", "GET, POST")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type, X-Auto-Anki-Token")
+        self.send_header("Vary", "Origin")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        rejected = self._rejection()
+        if rejected:
+            return self._send(rejected[0], {"error": rejected[1]})
+        url = urlparse(self.path)
+        if url.path == "/health":
+            return self._send(200, {"status": "ok", "pending": self.jobs.pending(),
+                                    "max_pending": self.jobs.max_pending})
+        if url.path.startswith("/jobs/"):
+            job = self.jobs.get(url.path[len("/jobs/"):])
+            if not job:
+                return self._send(404, {"error": "unknown job"})
+            return self._send(200, job_view(job))
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        rejected = self._rejection()
+        if rejected:
+            return self._send(rejected[0], {"error": rejected[1]})
+        # plain-text POSTs skip the CORS preflight, so browsers must send JSON
+        if self._from_browser() and "application/json" not in (self.headers.get("Content-Type") or ""):
+            return self._send(415, {"error": "browser requests must use Content-Type: application/json"})
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        try:
+            text = self._read_text().strip()
+        except (ValueError, UnicodeDecodeError) as e:
+            return self._send(400, {"error": f"bad request body: {e}"})
+        if not text:
+            return self._send(400, {"error": "empty text"})
+
+        if url.path == "/vocab":
+            job = self.jobs.submit("vocab", run_vocab, text)
+        elif url.path == "/phrase":
+            task = (query.get("task") or ["1"])[0]
+            if task not in ("1", "2"):
+                return self._send(400, {"error": "task must be 1 or 2"})
+            job = self.jobs.submit("phrase", run_phrase, text, int(task))
+        else:
+            return self._send(404, {"error": "not found"})
+
+        if job is None:
+            return self._send(503, {"error": "busy", "max_pending": self.jobs.max_pending},
+                              {"Retry-After": "1"})
+
+        if (query.get("wait") or ["1"])[0] != "0":
+            job["_done"].wait(SERVER_WAIT_TIMEOUT)
+        if job["_done"].is_set():
+            return self._send(500 if job["status"] == "failed" else 200, job_view(job))
+        self._send(202, job_view(job), {"Location": f"/jobs/{job['id']}"})
+
+
+def serve(host: str = SERVER_HOST, port: int = SERVER_PORT):
+    Handler.jobs = JobQueue(SERVER_WORKERS, SERVER_MAX_PENDING)
+    Handler.allowed_hosts = local_hosts(host, port)
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    log("===================================")
+    log("Auto Anki – headless API")
+    log(f"Listening on http://{host}:{port} ({SERVER_WORKERS} workers, max {SERVER_MAX_PENDING} pending)")
+    log("POST /vocab, POST /phrase?task=1|2, GET /jobs/<id>")
+    log("===================================")
+    vocab_anki.probe_anki(vocab_anki.refresh_config())
+    try:
+        phrase_anki = phrase_module()
+        phrase_anki.probe_anki(phrase_anki.refresh_config())
+    except RuntimeError as e:
+        log(f"{e}; POST /phrase will fail until it is fixed", level="WARN")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+def run_once(kind: str, text: str, task: int = 1) -> dict:
+    started = time.time()
+    job = {"kind": kind, "input": text, "status": "running", "error": None}
+    if kind == "phrase":
+        job["task"] = task
+    try:
+        job["status"] = (run_phrase(text, task) if kind == "phrase" else run_vocab(text)) or "done"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+        log_exception(e)
+    job["timing"] = {"total_s": round(time.time() - started, 3)}
+    return job
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Auto Anki headless API / CLI")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_serve = sub.add_parser("serve", help="run the local HTTP API")
+    p_serve.add_argument("--host", default=SERVER_HOST)
+    p_serve.add_argument("--port", type=int, default=SERVER_PORT)
+    p_vocab = sub.add_parser("vocab", help="create one vocab card")
+    p_vocab.add_argument("text", help="term or phrase ('-' reads stdin)")
+    p_phrase = sub.add_parser("phrase", help="create one IELTS sentence card")
+    p_phrase.add_argument("--task", type=int, choices=(1, 2), default=1)
+    p_phrase.add_argument("text", help="sentence with <target phrase> ('-' reads stdin)")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.host, args.port)
+        return
+
+    text = sys.stdin.read() if args.text == "-" else args.text
+    job = run_once(args.command, text.strip(), getattr(args, "task", 1))
+    print(json.dumps(job, ensure_ascii=False, indent=2))
+    sys.exit(0 if job["status"] != "failed" else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+
+# Anki "legacy" collection schema (ver 11). Every Anki desktop/mobile release
+# still imports it, so the package can be built without Anki installed.
+APKG_SCHEMA = """
+CREATE TABLE col (
+    id integer primary key, crt integer not null, mod integer not null,
+    scm integer not null, ver integer not null, dty integer not null,
+    usn integer not null, ls integer not null, conf text not null,
+    models text not null, decks text not null, dconf text not null,
+    tags text not null
+);
+CREATE TABLE notes (
+    id integer primary key, guid text not null, mid integer not null,
+    mod integer not null, usn integer not null, tags text not null,
+    flds text not null, sfld integer not null, csum integer not null,
+    flags integer not null, data text not null
+);
+CREATE TABLE cards (
+    id integer primary key, nid integer not null, did integer not null,
+    ord integer not null, mod integer not null, usn integer not null,
+    type integer not null, queue integer not null, due integer not null,
+    ivl integer not null, factor integer not null, reps integer not null,
+    lapses integer not null, left integer not null, odue integer not null,
+    odid integer not null, flags integer not null, data text not null
+);
+CREATE TABLE revlog (
+    id integer primary key, cid integer not null, usn integer not null,
+    ease integer not null, ivl integer not null, lastIvl integer not null,
+    factor integer not null, time integer not null, type integer not null
+);
+CREATE TABLE graves (
+    usn integer not null, oid integer not null, type integer not null
+);
+CREATE INDEX ix_notes_usn on notes (usn);
+CREATE INDEX ix_cards_usn on cards (usn);
+CREATE INDEX ix_revlog_usn on revlog (usn);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_cards_sched on cards (did, queue, due);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+CREATE INDEX ix_notes_csum on notes (csum);
+"""
+
+DEFAULT_CSS = """.card {
+ font-family: arial;
+ font-size: 20px;
+ text-align: center;
+ color: black;
+ background-color: white;
+}
+"""
+
+# Card templates per note type. The fields themselves always come from what the
+# scripts send to AnkiConnect; unknown models get a plain "first field" card.
+MODEL_TEMPLATES = {
+    "vocab": (
+        "{{Cloze}}<br>{{Image}}",
+        "{{FrontSide}}<hr id=answer>{{Word}} {{Phonetic symbol}}<br>{{Audio}}"
+        "<br>{{Definition}}<br>{{Extra information}}<br>{{Synonyms}}",
+    ),
+    "ielts": (
+        "{{Cloze}}<br>{{Definition}}<br>{{Image}}<br>{{type:Answer}}",
+        "{{FrontSide}}<hr id=answer>{{Sentence}}",
+    ),
+}
+
+
+def stable_id(*parts) -> int:
+    """Deterministic positive 63-bit id so re-exports reuse the same deck/model."""
+    digest = hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+    return int(digest[:15], 16) + (1 << 40)
+
+
+def strip_html(text: str) -> str:
+    return re.sub(r"<[^>]+>", "", text or "").strip()
+
+
+def field_checksum(text: str) -> int:
+    return int(hashlib.sha1(strip_html(text).encode("utf-8")).hexdigest()[:8], 16)
+
+
+def guess_templates(field_names):
+    if "Word" in field_names:
+        return MODEL_TEMPLATES["vocab"]
+    if "Sentence" in field_names:
+        return MODEL_TEMPLATES["ielts"]
+    first = field_names[0]
+    return "{{%s}}" % first, "{{FrontSide}}<hr id=answer>" + "<br>".join(
+        "{{%s}}" % f for f in field_names[1:])
+
+
+class ApkgWriter:
+    """Collect notes + media and write them as a single importable .apkg.
+
+    Media is streamed into the zip as soon as it is added so large exports do
+    not keep image bytes in memory; the SQLite collection is written on close().
+    Safe to use from several worker threads.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._zip = zipfile.ZipFile(self.path, "w", zipfile.ZIP_STORED)
+        self._media = {}
+        self._media_names = set()
+        self._models = {}
+        self._decks = {}
+        self._notes = []
+        self._seen = set()
+        self._next_id = int(time.time() * 1000)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def has_note(self, model: str, first_field: str) -> bool:
+        with self._lock:
+            return (model, strip_html(first_field)) in self._seen
+
+    def add_media(self, filename: str, data: bytes):
+        with self._lock:
+            if filename in self._media_names:
+                return
+            index = str(len(self._media))
+            self._zip.writestr(index, data)
+            self._media[index] = filename
+            self._media_names.add(filename)
+
+    def add_note(self, deck: str, model: str, fields: dict, tags=None):
+        names = list(fields.keys())
+        values = [str(fields.get(n) or "") for n in names]
+        with self._lock:
+            mid = self._models.get(model, {}).get("id")
+            if mid is None:
+                mid = self._add_model(model, names)
+            elif self._models[model]["field_names"] != names:
+                raise ValueError(f"Fields for model {model!r} changed within one export")
+            did = self._decks.get(deck) or self._add_deck(deck)
+            self._seen.add((model, strip_html(values[0])))
+            self._notes.append({
+                "id": self._new_id(),
+                "guid": str(stable_id(deck, model, values[0])),
+                "mid": mid,
+                "did": did,
+                "tags": " ".join(tags or []),
+                "fields": values,
+            })
+
+    def _add_model(self, name, field_names):
+        mid = stable_id("model", name)
+        self._models[name] = {"id": mid, "field_names": field_names}
+        return mid
+
+    def _add_deck(self, name):
+        did = stable_id("deck", name)
+        self._decks[name] = did
+        return did
+
+    def _models_json(self, now):
+        out = {}
+        for name, m in self._models.items():
+            qfmt, afmt = guess_templates(m["field_names"])
+            out[str(m["id"])] = {
+                "id": m["id"],
+                "name": name,
+                "type": 0,
+                "mod": now,
+                "usn": -1,
+                "sortf": 0,
+                "did": None,
+                "tmpls": [{
+                    "name": "Card 1", "ord": 0, "qfmt": qfmt, "afmt": afmt,
+                    "did": None, "bqfmt": "", "bafmt": "",
+                }],
+                "flds": [{
+                    "name": f, "ord": i, "sticky": False, "rtl": False,
+                    "font": "Arial", "size": 20, "media": [],
+                } for i, f in enumerate(m["field_names"])],
+                "css": DEFAULT_CSS,
+                "latexPre": "\\documentclass[12pt]{article}\n\\begin{document}\n",
+                "latexPost": "\\end{document}",
+                "latexsvg": False,
+                "req": [[0, "any", [0]]],
+                "tags": [],
+                "vers": [],
+            }
+        return out
+
+    def _decks_json(self, now):
+        def deck(did, name):
+            return {
+                "id": did, "name": name, "mod": now, "usn": -1,
+                "lrnToday": [0, 0], "revToday": [0, 0], "newToday": [0, 0],
+                "timeToday": [0, 0], "collapsed": False, "browserCollapsed": False,
+                "desc": "", "dyn": 0, "conf": 1, "extendNew": 0, "extendRev": 0,
+            }
+        out = {"1": deck(1, "Default")}
+        for name, did in self._decks.items():
+            out[str(did)] = deck(did, name)
+        return out
+
+    def _dconf_json(self, now):
+        return {"1": {
+            "id": 1, "name": "Default", "mod": now, "usn": -1, "maxTaken": 60,
+            "autoplay": True, "timer": 0, "replayq": True, "dyn": False,
+            "new": {"delays": [1, 10], "ints": [1, 4, 7], "initialFactor": 2500,
+                    "order": 1, "perDay": 20, "bury": True, "separate": True},
+            "rev": {"perDay": 200, "ease4": 1.3, "fuzz": 0.05, "ivlFct": 1,
+                    "maxIvl": 36500, "bury": True, "minSpace": 1},
+            "lapse": {"delays": [10], "mult": 0, "minInt": 1, "leechFails": 8,
+                      "leechAction": 0},
+        }}
+
+    def _write_collection(self, db_path):
+        now = int(time.time())
+        conn = sqlite3.connect(db_path)
+        try:
+            conn.executescript(APKG_SCHEMA)
+            conf = {
+                "activeDecks": [1], "curDeck": 1, "newSpread": 0,
+                "collapseTime": 1200, "timeLim": 0, "estTimes": True,
+                "dueCounts": True, "curModel": None, "nextPos": len(self._notes) + 1,
+                "sortType": "noteFld", "sortBackwards": False, "addToCur": True,
+            }
+            conn.execute(
+                "INSERT INTO col VALUES (1, ?, ?, ?, 11, 0, 0, 0, ?, ?, ?, ?, '{}')",
+                (now, now * 1000, now * 1000, json.dumps(conf),
+                 json.dumps(self._models_json(now)), json.dumps(self._decks_json(now)),
+                 json.dumps(self._dconf_json(now))),
+            )
+            conn.executemany(
+                "INSERT INTO notes VALUES (?, ?, ?, ?, -1, ?, ?, ?, ?, 0, '')",
+                ((n["id"], n["guid"], n["mid"], now,
+                  f" {n['tags']} " if n["tags"] else "",
+                  "\x1f".join(n["fields"]), strip_html(n["fields"][0]),
+                  field_checksum(n["fields"][0])) for n in self._notes),
+            )
+            conn.executemany(
+                "INSERT INTO cards VALUES (?, ?, ?, 0, ?, -1, 0, 0, ?, 0, 0, 0, 0, 0, 0, 0, 0, '')",
+                ((n["id"], n["id"], n["did"], now, pos)
+                 for pos, n in enumerate(self._notes, start=1)),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            if self._zip is None:
+                return
+            fd, db_path = tempfile.mkstemp(suffix=".anki2")
+            os.close(fd)
+            try:
+                self._write_collection(db_path)
+                self._zip.write(db_path, "collection.anki2", zipfile.ZIP_DEFLATED)
+                self._zip.writestr("media", json.dumps(self._media))
+            finally:
+                self._zip.close()
+                self._zip = None
+                os.remove(db_path)
@@ -0,0 +1,69 @@
+import requests
+
+# (offset, signature) -> extension. WebP is "RIFF....WEBP", checked separately.
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+]
+SNIFF_BYTES = 12
+
+
+class DownloadRejected(Exception):
+    """Raised when a candidate URL (image or audio) is not worth (or not safe)
+    to keep downloading."""
+
+
+def sniff_image_type(head: bytes) -> str | None:
+    """Return the file extension for JPEG/PNG/GIF/WebP magic bytes, else None."""
+    for sig, ext in IMAGE_SIGNATURES:
+        if head.startswith(sig):
+            return ext
+    if len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def sniff_mp3(head: bytes) -> str | None:
+    """Return "mp3" for an ID3 tag or an MPEG audio frame header, else None."""
+    if head.startswith(b"ID3") or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "mp3"
+    return None
+
+
+def download_capped(url: str, headers: dict, max_bytes: int, timeout: float = 10,
+                   sniff=sniff_image_type) -> tuple[bytes, str]:
+    """Stream `url` and return (bytes, extension).
+
+    The transfer is aborted as soon as Content-Length or the running byte count
+    exceeds `max_bytes`, or when `sniff` doesn't recognise the first bytes
+    (default: image formats), so oversized files and HTML error pages cost
+    only their first chunk.
+    """
+    with requests.get(url, headers=headers, timeout=timeout, stream=True) as r:
+        if r.status_code != 200:
+            raise DownloadRejected(f"status {r.status_code}")
+
+        length = r.headers.get("Content-Length", "")
+        if length.isdigit() and int(length) > max_bytes:
+            raise DownloadRejected(f"Content-Length {length} exceeds cap {max_bytes}")
+
+        chunks = r.iter_content(chunk_size=8192)
+        buf = bytearray()
+        for chunk in chunks:
+            buf += chunk
+            if len(buf) >= SNIFF_BYTES:
+                break
+
+        ext = sniff(bytes(buf[:SNIFF_BYTES]))
+        if not ext:
+            ctype = r.headers.get("Content-Type", "")
+            raise DownloadRejected(f"unexpected format (content-type={ctype!r}, head={bytes(buf[:SNIFF_BYTES])!r})")
+
+        for chunk in chunks:
+            buf += chunk
+            if len(buf) > max_bytes:
+                raise DownloadRejected(f"body exceeds cap {max_bytes} bytes")
+
+        return bytes(buf), ext
@@ -0,0 +1,110 @@
+import re
+import threading
+from pathlib import Path
+
+PLACEHOLDER_RE = re.compile(r"\{\{(\w+)\}\}")
+
+
+def parse_config(text: str) -> dict:
+    """Parse `KEY=value` lines; blank lines and `#` comments are ignored."""
+    config = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "=" not in line:
+            continue
+        k, v = line.split("=", 1)
+        config[k.strip()] = v.strip()
+    return config
+
+
+class WatchedFile:
+    """Keep the parsed form of a text file in memory and re-parse it only when
+    its mtime/size changes.
+
+    `parse` turns the file text into whatever the caller needs. If a re-parse
+    fails (bad value, file half-written, file removed) the error is passed to
+    `on_error` and the previous value stays active; only the very first load
+    raises. `version` increases on every successful reload.
+    """
+
+    def __init__(self, path, parse, on_error=None):
+        self.path = Path(path)
+        self._parse = parse
+        self._on_error = on_error
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._value = None
+        self._loaded = False
+        self.version = 0
+
+    def get(self):
+        with self._lock:
+            try:
+                st = self.path.stat()
+                stamp = (st.st_mtime_ns, st.st_size)
+            except OSError as e:
+                if not self._loaded:
+                    raise
+                stamp = None
+                error = e
+            if stamp == self._stamp:
+                return self._value
+            if stamp is not None:
+                try:
+                    value = self._parse(self.path.read_text(encoding="utf-8"))
+                except Exception as e:
+                    if not self._loaded:
+                        raise
+                    error = e
+                else:
+                    self._value, self._stamp, self._loaded = value, stamp, True
+                    self.version += 1
+                    return self._value
+            # remember the broken stamp so the same error is reported once
+            self._stamp = stamp
+            if self._on_error:
+                self._on_error(self.path, error)
+            return self._value
+
+
+class PromptTemplate(WatchedFile):
+    """Prompt file kept pre-split on its `{{NAME}}` placeholders."""
+
+    def __init__(self, path, on_error=None):
+        super().__init__(path, PLACEHOLDER_RE.split, on_error)
+
+    @staticmethod
+    def _join(parts, values) -> str:
+        return "".join(
+            part if i % 2 == 0 else (values[part] if part in values else "{{%s}}" % part)
+            for i, part in enumerate(parts)
+        )
+
+    def render(self, **values) -> str:
+        return self._join(self.get(), values)
+
+    def static_prefix(self, stop: str, **values) -> str:
+        """Rendered text before the first `{{stop}}` placeholder: the part of
+        the prompt that is the same for every item ("" if there is none)."""
+        parts = self.get()
+        names = parts[1::2]
+        if stop not in names:
+            return ""
+        return self._join(parts[:2 * names.index(stop) + 1], values)
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def get_template(path, on_error=None) -> PromptTemplate:
+    """Shared PromptTemplate per resolved path, so a config change that points
+    to another prompt file simply picks up (or creates) that file's entry."""
+    key = Path(path).resolve()
+    with _templates_lock:
+        tpl = _templates.get(key)
+        if tpl is None:
+            tpl = _templates[key] = PromptTemplate(key, on_error)
+        return tpl
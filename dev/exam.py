@@ -1,8 +1,28 @@
+import sys
+from pathlib import Path
+
 import requests
 
-ANKI_URL = "http://127.0.0.1:8765"
-DECK = "Open Source English"
-MODEL = "Open Source"
+from config_store import parse_config
+from anki_schema import AnkiSchema
+
+CONFIG_FILE = Path("auto_anki_config.txt")
+
+VOCAB_FIELDS = ["Word", "Cloze", "Phonetic symbol", "Audio", "Definition",
+                "Extra information", "Synonyms", "Image"]
+PHRASE_FIELDS = ["Sentence", "Cloze", "Answer", "Definition", "Image"]
+
+config = parse_config(CONFIG_FILE.read_text(encoding="utf-8")) if CONFIG_FILE.exists() else {}
+ANKI_URL = config.get("ANKI_URL", "http://127.0.0.1:8765")
+
+# (label, deck, model, fields) for every note the scripts may add
+TARGETS = [
+    ("vocab", config.get("DECK", "Default"), config.get("MODEL", "Basic"), VOCAB_FIELDS),
+    ("ielts task 1", config.get("DECK_TASK1", "Review Task 1"),
+     config.get("MODEL_TASK1", "IELTS Writing Revise"), PHRASE_FIELDS),
+    ("ielts task 2", config.get("DECK_TASK2", "Review Task 2"),
+     config.get("MODEL_TASK2", "IELTS Writing Task 2"), PHRASE_FIELDS),
+]
 
 def anki(action, params=None):
     payload = {
@@ -10,7 +30,7 @@ def anki(action, params=None):
         "version": 6,
         "params": params or {}
     }
-    r = requests.post(ANKI_URL, json=payload)
+    r = requests.post(ANKI_URL, json=payload, timeout=10)
     r.raise_for_status()
     res = r.json()
 
@@ -20,27 +40,26 @@ def anki(action, params=None):
     return res["result"]
 
 def main():
-    print("Đang test addNote vào Anki...")
-
-    result = anki("addNote", {
-        "note": {
-            "deckName": DECK,
-            "modelName": MODEL,
-            "fields": {
-                "Word": "testword",
-                "Cloze": "te__d",
-                "Phonetic symbol": "",
-                "Audio": "",
-                "Definition": "This is a test definition",
-                "Extra information": "This is extra info",
-                "Synonyms": "test, trial"
-            },
-            "tags": ["debug"]
-        }
-    })
-
-    print("KẾT QUẢ:", result)
-    print("Nếu không có exception thì card đã được add thật sự.")
+    """Check AnkiConnect and the configured decks / note types / fields in one
+    request, without adding anything."""
+    print(f"Đang kiểm tra AnkiConnect tại {ANKI_URL} ...")
+
+    try:
+        info = AnkiSchema().probe(anki, [model for _, _, model, _ in TARGETS])
+    except Exception as e:
+        print("KHÔNG KẾT NỐI ĐƯỢC:", e)
+        sys.exit(2)
+
+    print(f"AnkiConnect v{info['version']}: {len(info['decks'])} decks, {len(info['models'])} note types")
+    ok = True
+    for label, deck, model, fields in TARGETS:
+        problems = AnkiSchema.problems(info, deck, model, fields)
+        print(f"[{'OK' if not problems else 'LỖI'}] {label}: deck={deck!r} model={model!r}")
+        for problem in problems:
+            print("    -", problem)
+        ok = ok and not problems
+
+    sys.exit(0 if ok else 1)
 
 if __name__ == "__main__":
     main()
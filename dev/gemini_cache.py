@@ -0,0 +1,140 @@
+import hashlib
+import threading
+import time
+
+import requests
+
+# After a failed upload (caching unsupported by the model/plan, quota, ...)
+# don't retry for this long; the full prompt is sent.
+FAILURE_BACKOFF_S = 600
+
+# Rough chars-per-token ratio used to compare a prefix with the model minimum.
+CHARS_PER_TOKEN = 4
+
+
+def cache_endpoints(generate_url: str):
+    """Map `.../v1beta/models/<model>:generateContent` to the cachedContents
+    collection URL and the model resource name, or (None, None)."""
+    if "/models/" not in generate_url:
+        return None, None
+    base, rest = generate_url.split("/models/", 1)
+    return f"{base}/cachedContents", "models/" + rest.split(":", 1)[0]
+
+
+class GeminiContextCache:
+    """Upload a prompt template's static prefix once as Gemini cached content.
+
+    One entry per `slot` (e.g. "vocab", "ielts"). The entry is re-uploaded when
+    the prefix changes (template edited, TARGET_LANGS changed, ...) and its TTL
+    is extended shortly before it expires.
+
+    Uploads, extensions and deletes run outside the shared lock, one at a time
+    per slot; calls arriving meanwhile send the full prompt instead of waiting.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._failed_until = {}
+        self._slot_locks = {}
+
+    def cached_content(self, slot: str, generate_url: str, api_key: str, prefix: str,
+                       ttl_s: int, log=None, min_tokens: int = 0) -> str | None:
+        """Return the cachedContents name holding `prefix`, or None to fall back.
+
+        Prefixes estimated below `min_tokens` (the model's minimum cacheable
+        size) are never uploaded.
+        """
+        collection_url, model = cache_endpoints(generate_url)
+        if not collection_url or not prefix.strip():
+            return None
+        digest = hashlib.sha256(f"{generate_url}\x1f{prefix}".encode("utf-8")).hexdigest()
+        headers = {"Content-Type": "application/json", "X-goog-api-key": api_key}
+        now = time.monotonic()
+
+        with self._lock:
+            if self._failed_until.get(digest, 0) > now:
+                return None
+            if len(prefix) / CHARS_PER_TOKEN < min_tokens:
+                self._failed_until[digest] = float("inf")
+                if log:
+                    log(f"Gemini context cache skipped for {slot}: prefix is ~{len(prefix) // CHARS_PER_TOKEN} "
+                        f"tokens, below the {min_tokens}-token minimum")
+                return None
+            entry = self._entries.get(slot)
+            if self._fresh(entry, digest, now, ttl_s):
+                return entry["name"]
+            slot_lock = self._slot_locks.setdefault(slot, threading.Lock())
+
+        if not slot_lock.acquire(blocking=False):
+            # another call is uploading/extending this slot right now
+            usable = entry and entry["digest"] == digest and entry["expires"] - now > 5
+            return entry["name"] if usable else None
+
+        try:
+            with self._lock:
+                entry = self._entries.get(slot)
+                if self._fresh(entry, digest, now, ttl_s):
+                    return entry["name"]
+
+            if entry and entry["digest"] == digest and entry["expires"] - now > 5:
+                expires = self._extend(entry, collection_url, headers, ttl_s, log)
+                if expires:
+                    with self._lock:
+                        entry["expires"] = expires
+                    return entry["name"]
+
+            if entry:
+                self._delete(entry, collection_url, headers)
+
+            try:
+                r = requests.post(collection_url, headers=headers, timeout=30, json={
+                    "model": model,
+                    "contents": [{"role": "user", "parts": [{"text": prefix}]}],
+                    "ttl": f"{ttl_s}s",
+                })
+                r.raise_for_status()
+                name = r.json()["name"]
+            except Exception as e:
+                with self._lock:
+                    self._entries.pop(slot, None)
+                    self._failed_until[digest] = time.monotonic() + FAILURE_BACKOFF_S
+                if log:
+                    log(f"Gemini context cache unavailable, sending full prompts: {e}", level="WARN")
+                return None
+
+            with self._lock:
+                self._entries[slot] = {"name": name, "digest": digest, "expires": time.monotonic() + ttl_s}
+            if log:
+                log(f"Gemini context cache created: {name} ({len(prefix)} chars, ttl {ttl_s}s)")
+            return name
+        finally:
+            slot_lock.release()
+
+    def invalidate(self, slot: str):
+        """Forget the entry, e.g. when generateContent says it no longer exists."""
+        with self._lock:
+            self._entries.pop(slot, None)
+
+    @staticmethod
+    def _fresh(entry, digest, now, ttl_s) -> bool:
+        return bool(entry) and entry["digest"] == digest and entry["expires"] - now > max(60, ttl_s * 0.1)
+
+    def _extend(self, entry, collection_url, headers, ttl_s, log) -> float | None:
+        name_url = f"{collection_url.rsplit('/cachedContents', 1)[0]}/{entry['name']}"
+        try:
+            r = requests.patch(name_url, headers=headers, params={"updateMask": "ttl"},
+                               json={"ttl": f"{ttl_s}s"}, timeout=15)
+            r.raise_for_status()
+        except Exception as e:
+            if log:
+                log(f"Gemini context cache refresh failed, re-uploading: {e}", level="DEBUG")
+            return None
+        return time.monotonic() + ttl_s
+
+    def _delete(self, entry, collection_url, headers):
+        name_url = f"{collection_url.rsplit('/cachedContents', 1)[0]}/{entry['name']}"
+        try:
+            requests.delete(name_url, headers=headers, timeout=10)
+        except Exception:
+            pass  # it expires on its own
@@ -0,0 +1,470 @@
+"""Load-test the vocab and IELTS pipelines against local upstream stand-ins.
+
+    python loadtest.py --rate 60 --duration 300 --concurrency 8 corpus.txt
+    python loadtest.py --set gemini_429_burst_s=20 --set anki_stall_rate=0.05
+
+Each corpus line is one job: lines containing <...> go through the IELTS
+pipeline, everything else through the vocab pipeline. Jobs arrive as a
+Poisson process at --rate per minute. Cambridge, Bing, image hosts, Gemini
+and AnkiConnect are replaced by one local HTTP server whose latency
+distributions, 429 bursts, slow/broken image hosts and AnkiConnect stalls
+come from SCENARIO (override with --scenario file.json / --set key=value).
+The scripts run unmodified, pointed at the stand-ins through a temporary
+auto_anki_config.txt.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+SCENARIO = {
+    # lognormal latency: median in ms + sigma
+    "cambridge_ms": 600, "cambridge_sigma": 0.5,
+    "cambridge_miss_rate": 0.1,      # 404 -> Gemini fallback in hybrid mode
+    "cambridge_page_kb": 120,        # page size, so lxml parsing cost is realistic
+    "bing_ms": 500, "bing_sigma": 0.5,
+    "bing_candidates": 8,
+    "image_ms": 300, "image_sigma": 0.8,
+    "image_kb": 80,
+    "slow_image_rate": 0.1, "slow_image_s": 8,
+    "bad_image_rate": 0.1,           # HTML error page served as an image
+    "gemini_ms": 1500, "gemini_sigma": 0.4,
+    "gemini_429_rate": 0.02,
+    "gemini_429_period_s": 60, "gemini_429_burst_s": 5,   # every period, burst seconds of 429s
+    "anki_ms": 20, "anki_sigma": 0.3,
+    "anki_stall_rate": 0.01, "anki_stall_s": 5,
+}
+
+DEFAULT_CORPUS = [
+    "ubiquitous", "mitigate", "resilient", "alleviate", "unprecedented",
+    "detrimental", "sustainable", "infrastructure", "disparity", "proliferation",
+    "take into account", "a double-edged sword", "bring about", "in the long run",
+    "Some people argue that shops should be permitted to sell food that is <scientifically proven> to be harmful.",
+    "The graph shows a <steady increase> in the number of international students.",
+    "Governments should <allocate funding> to public transport rather than roads.",
+    "Online learning has <gained traction> among working adults in recent years.",
+]
+
+
+def sample_latency(median_ms: float, sigma: float) -> float:
+    if median_ms <= 0:
+        return 0.0
+    return random.lognormvariate(math.log(median_ms / 1000), sigma)
+
+
+def current_rss() -> int | None:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100
+    lo, hi = math.floor(k), math.ceil(k)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+# ---------- Stand-in upstreams ----------
+class StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, scenario: dict):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.scenario = scenario
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.note_ids = itertools.count(1)
+        self.cached_contents = {}
+        self.cache_ids = itertools.count(1)
+        self.image_body = b"\xff\xd8\xff\xe0" + os.urandom(max(0, scenario["image_kb"] * 1024 - 4))
+        self.audio_body = b"ID3" + os.urandom(12 * 1024)
+        filler = "<p>" + "lorem ipsum dolor sit amet " * 20 + "</p>\n"
+        self.cambridge_filler = filler * max(1, scenario["cambridge_page_kb"] * 1024 // len(filler))
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, key: str, n: int = 1):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def gemini_throttled(self) -> bool:
+        sc = self.scenario
+        t = time.monotonic() - self.started
+        if sc["gemini_429_period_s"] > 0 and t % sc["gemini_429_period_s"] < sc["gemini_429_burst_s"]:
+            return True
+        return random.random() < sc["gemini_429_rate"]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    server: StandIn
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status: int, body: bytes, ctype: str):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, obj):
+        self._reply(status, json.dumps(obj).encode("utf-8"), "application/json")
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        sc, srv = self.server.scenario, self.server
+        url = urlparse(self.path)
+
+        if url.path.startswith("/dictionary/english/"):
+            srv.count("cambridge")
+            time.sleep(sample_latency(sc["cambridge_ms"], sc["cambridge_sigma"]))
+            if random.random() < sc["cambridge_miss_rate"]:
+                srv.count("cambridge_404")
+                return self._reply(404, b"not found", "text/html")
+            word = url.path.rsplit("/", 1)[-1]
+            html = (
+                f'<html><body><span class="ipa dipa">/{word}/</span>'
+                f'<div class="def ddef_d db">a stand-in definition of {word}</div>'
+                f'<span class="examp dexamp">An example with {word}.</span>'
+                f'<span class="examp dexamp">Another example with {word}.</span>'
+                f'<a class="xref syn">synonym</a>'
+                f'<span class="uk dpron-i"><audio><source type="audio/mpeg" '
+                f'src="/media/english/uk_pron/{word}.mp3"/></audio></span>'
+                f'{srv.cambridge_filler}</body></html>'
+            )
+            return self._reply(200, html.encode("utf-8"), "text/html; charset=utf-8")
+
+        if url.path == "/images/search":
+            srv.count("bing")
+            time.sleep(sample_latency(sc["bing_ms"], sc["bing_sigma"]))
+            anchors = "".join(
+                f'<a class="iusc" m=\'{{"murl":"{srv.base_url}/img/{random.randrange(10**9)}.jpg"}}\'></a>'
+                for _ in range(sc["bing_candidates"])
+            )
+            return self._reply(200, f"<html><body>{anchors}</body></html>".encode(), "text/html")
+
+        if url.path.startswith("/media/"):
+            srv.count("audio")
+            time.sleep(sample_latency(sc["image_ms"], sc["image_sigma"]))
+            return self._reply(200, srv.audio_body, "audio/mpeg")
+
+        if url.path.startswith("/img/"):
+            srv.count("image")
+            if random.random() < sc["slow_image_rate"]:
+                srv.count("image_slow")
+                time.sleep(sc["slow_image_s"])
+            else:
+                time.sleep(sample_latency(sc["image_ms"], sc["image_sigma"]))
+            if random.random() < sc["bad_image_rate"]:
+                srv.count("image_bad")
+                return self._reply(200, b"<html>error</html>", "image/jpeg")
+            return self._reply(200, srv.image_body, "image/jpeg")
+
+        self._reply(404, b"", "text/plain")
+
+    def do_POST(self):
+        sc, srv = self.server.scenario, self.server
+        url = urlparse(self.path)
+        body = self._read_json()
+
+        if url.path.endswith("/cachedContents"):
+            # context cache upload (see gemini_cache.py)
+            srv.count("gemini_cache_create")
+            name = f"cachedContents/{next(srv.cache_ids)}"
+            with srv.lock:
+                srv.cached_contents[name] = body["contents"][0]["parts"][0]["text"]
+            return self._json(200, {"name": name, "model": body.get("model")})
+
+        if url.path.endswith(":generateContent"):
+            srv.count("gemini")
+            if body.get("cachedContent"):
+                with srv.lock:
+                    known = body["cachedContent"] in srv.cached_contents
+                if not known:
+                    return self._json(404, {"error": {"code": 404, "status": "NOT_FOUND"}})
+                srv.count("gemini_cached_calls")
+            prompt = body["contents"][-1]["parts"][0]["text"]
+            srv.count("gemini_prompt_chars", len(prompt))
+            time.sleep(sample_latency(sc["gemini_ms"], sc["gemini_sigma"]))
+            if srv.gemini_throttled():
+                srv.count("gemini_429")
+                return self._json(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}})
+            if "/vocab/" in url.path:
+                text = json.dumps({
+                    "term": "term", "ipa_uk": "", "definition_en": "a stand-in definition",
+                    "translations": {"vi": "bản dịch"}, "examples_en": ["An example."],
+                    "synonyms": ["synonym"], "visualSearchQuery": "a concrete scene",
+                })
+            else:
+                text = ("Sentence:\nA stand-in sentence.\n\nCloze:\nA ___ sentence.\n\n"
+                        "Answer:\nstand-in\n\nHint:\nmột gợi ý ngắn gọn\n")
+            return self._json(200, {"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+        if url.path == "/anki":
+            srv.count("anki")
+            if random.random() < sc["anki_stall_rate"]:
+                srv.count("anki_stall")
+                time.sleep(sc["anki_stall_s"])
+            else:
+                time.sleep(sample_latency(sc["anki_ms"], sc["anki_sigma"]))
+            return self._json(200, {"result": self._anki_result(body), "error": None})
+
+        self._reply(404, b"", "text/plain")
+
+    def do_PATCH(self):
+        self._read_json()
+        name = "cachedContents/" + urlparse(self.path).path.rsplit("/", 1)[-1]
+        self.server.count("gemini_cache_refresh")
+        with self.server.lock:
+            known = name in self.server.cached_contents
+        self._json(200 if known else 404, {"name": name})
+
+    def do_DELETE(self):
+        name = "cachedContents/" + urlparse(self.path).path.rsplit("/", 1)[-1]
+        self.server.count("gemini_cache_delete")
+        with self.server.lock:
+            self.server.cached_contents.pop(name, None)
+        self._json(200, {})
+
+    def _anki_result(self, body):
+        action, params = body.get("action"), body.get("params") or {}
+        if action == "multi":
+            return [{"result": self._anki_result(a), "error": None} for a in params.get("actions", [])]
+        if action == "findNotes":
+            return []
+        if action == "addNote":
+            return next(self.server.note_ids)
+        if action == "storeMediaFile":
+            return params.get("filename")
+        if action == "version":
+            return 6
+        if action == "deckNames":
+            return ["Default"] + ANKI_DECKS
+        if action == "modelNames":
+            return list(ANKI_MODELS)
+        if action == "modelFieldNames":
+            return ANKI_MODELS.get(params.get("modelName"))
+        return None
+
+
+# ---------- Harness ----------
+ANKI_DECKS = ["Load Test", "Load Test 1", "Load Test 2"]
+ANKI_MODELS = {
+    "Load Test": ["Word", "Cloze", "Phonetic symbol", "Audio", "Definition",
+                  "Extra information", "Synonyms", "Image"],
+    "Load Test IELTS": ["Sentence", "Cloze", "Answer", "Definition", "Image"],
+}
+
+
+def write_config(workdir: Path, base_url: str, extra: dict):
+    config = {
+        "ANKI_URL": f"{base_url}/anki",
+        "DECK": "Load Test", "MODEL": "Load Test",
+        "DECK_TASK1": "Load Test 1", "MODEL_TASK1": "Load Test IELTS",
+        "DECK_TASK2": "Load Test 2", "MODEL_TASK2": "Load Test IELTS",
+        "VOCAB_SOURCE": "hybrid", "TARGET_LANGS": "vi",
+        "GEMINI_API_KEY": "loadtest",
+        "GEMINI_URL": f"{base_url}/gemini/ielts/models/stand-in:generateContent",
+        "VOCAB_GEMINI_URL": f"{base_url}/gemini/vocab/models/stand-in:generateContent",
+        "PROMPT_FILE": "prompt.txt", "VOCAB_PROMPT_FILE": "vocab_prompt.txt",
+        "CAMBRIDGE_URL": f"{base_url}/dictionary/english/",
+        "BING_IMAGES_URL": f"{base_url}/images/search",
+    }
+    config.update(extra)
+    lines = [f"{k}={v}" for k, v in config.items()]
+    (workdir / "auto_anki_config.txt").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    for name in ("prompt.txt", "vocab_prompt.txt"):
+        shutil.copy(SCRIPT_DIR / name, workdir / name)
+
+
+def run_load(corpus, rate_per_min, duration_s, concurrency, task, out=sys.stdout):
+    import vocab_anki
+    import phrase_anki
+
+    results = []
+    rss_samples = []
+    lock = threading.Lock()
+    stop = threading.Event()
+    started = time.monotonic()
+
+    def sample_rss():
+        while not stop.is_set():
+            rss = current_rss()
+            if rss is not None:
+                rss_samples.append((time.monotonic() - started, rss))
+            stop.wait(1.0)
+
+    def job(text, arrived):
+        kind = "ielts" if "<" in text and ">" in text else "vocab"
+        try:
+            if kind == "ielts":
+                status = phrase_anki.create_sentence_card(text, task)
+            else:
+                status = vocab_anki.create_vocab_card(text)
+        except Exception as e:
+            status = f"error:{type(e).__name__}"
+        with lock:
+            results.append({"kind": kind, "status": status, "latency": time.monotonic() - arrived})
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    items = itertools.cycle(corpus)
+    submitted = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        next_arrival = started
+        while True:
+            next_arrival += random.expovariate(rate_per_min / 60)
+            if next_arrival - started > duration_s:
+                break
+            time.sleep(max(0.0, next_arrival - time.monotonic()))
+            pool.submit(job, next(items), time.monotonic())
+            submitted += 1
+            if submitted % 50 == 0:
+                print(f"  {time.monotonic() - started:6.0f}s submitted={submitted} done={len(results)}",
+                      file=out, flush=True)
+        print(f"  arrivals finished ({submitted}), draining in-flight jobs...", file=out, flush=True)
+    stop.set()
+    sampler.join()
+    return {"elapsed": time.monotonic() - started, "submitted": submitted,
+            "results": results, "rss": rss_samples}
+
+
+def report(run, server: StandIn, args) -> dict:
+    elapsed = run["elapsed"]
+    summary = {"elapsed_s": round(elapsed, 1), "submitted": run["submitted"], "kinds": {},
+               "upstream": dict(server.counters)}
+    for kind in ("vocab", "ielts"):
+        rows = [r for r in run["results"] if r["kind"] == kind]
+        if not rows:
+            continue
+        statuses = {}
+        for r in rows:
+            statuses[r["status"]] = statuses.get(r["status"], 0) + 1
+        lat = [r["latency"] for r in rows]
+        errors = sum(1 for r in rows if r["status"].startswith("error"))
+        summary["kinds"][kind] = {
+            "jobs": len(rows),
+            "added_per_min": round(statuses.get("added", 0) / elapsed * 60, 2),
+            "error_rate": round(errors / len(rows), 4),
+            "statuses": statuses,
+            "latency_s": {p: round(percentile(lat, v), 3)
+                          for p, v in (("p50", 50), ("p90", 90), ("p99", 99), ("max", 100))},
+        }
+    if run["rss"]:
+        mib = [r / 2**20 for _, r in run["rss"]]
+        step = max(1, len(run["rss"]) // 10)
+        summary["rss_mib"] = {
+            "start": round(mib[0], 1), "end": round(mib[-1], 1), "max": round(max(mib), 1),
+            "timeline": [(round(t), round(r / 2**20, 1)) for t, r in run["rss"][::step]],
+        }
+
+    print("\n========== Load test report ==========")
+    print(f"Duration {elapsed:.1f}s, arrival rate {args.rate}/min, concurrency {args.concurrency}, "
+          f"submitted {run['submitted']}")
+    for kind, k in summary["kinds"].items():
+        lat = k["latency_s"]
+        print(f"{kind:6s} jobs={k['jobs']:5d}  added/min={k['added_per_min']:7.2f}  "
+              f"errors={k['error_rate'] * 100:5.1f}%  p50={lat['p50']:.2f}s p90={lat['p90']:.2f}s "
+              f"p99={lat['p99']:.2f}s max={lat['max']:.2f}s")
+        print(f"       statuses: {k['statuses']}")
+    if "rss_mib" in summary:
+        r = summary["rss_mib"]
+        print(f"RSS MiB: start={r['start']} end={r['end']} max={r['max']}")
+        print("        " + "  ".join(f"{t}s:{v}" for t, v in r["timeline"]))
+    print(f"Upstream requests: {summary['upstream']}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Auto Anki load-test harness")
+    parser.add_argument("corpus", nargs="?", type=Path,
+                        help="one term or <...> sentence per line (default: small built-in corpus)")
+    parser.add_argument("--rate", type=float, default=30, help="job arrivals per minute")
+    parser.add_argument("--duration", type=float, default=120, help="seconds of arrivals")
+    parser.add_argument("--concurrency", type=int, default=8, help="jobs processed in parallel")
+    parser.add_argument("--task", type=int, choices=(1, 2), default=1, help="IELTS task for <...> lines")
+    parser.add_argument("--scenario", type=Path, help="JSON file overriding SCENARIO values")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="override one SCENARIO value")
+    parser.add_argument("--config", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra auto_anki_config.txt entry for the pipelines")
+    parser.add_argument("--json", type=Path, help="also write the report as JSON")
+    parser.add_argument("--keep", action="store_true", help="keep the work dir (config + pipeline log)")
+    args = parser.parse_args()
+
+    scenario = dict(SCENARIO)
+    if args.scenario:
+        scenario.update(json.loads(args.scenario.read_text(encoding="utf-8")))
+    for item in args.set:
+        key, value = item.split("=", 1)
+        if key not in SCENARIO:
+            parser.error(f"unknown scenario key: {key}")
+        scenario[key] = type(SCENARIO[key])(float(value)) if isinstance(SCENARIO[key], (int, float)) else value
+    extra = dict(item.split("=", 1) for item in args.config)
+    if args.json:
+        args.json = args.json.resolve()
+
+    corpus = DEFAULT_CORPUS
+    if args.corpus:
+        corpus = [ln.strip() for ln in args.corpus.read_text(encoding="utf-8").splitlines()
+                  if ln.strip() and not ln.startswith("#")]
+
+    server = StandIn(scenario)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    workdir = Path(tempfile.mkdtemp(prefix="anki-loadtest-"))
+    write_config(workdir, server.base_url, extra)
+    os.chdir(workdir)
+    sys.path.insert(0, str(SCRIPT_DIR))
+    print(f"Stand-ins on {server.base_url}, work dir {workdir}")
+
+    out = sys.stdout
+    with open(workdir / "pipeline.log", "w", encoding="utf-8") as logf, contextlib.redirect_stdout(logf):
+        run = run_load(corpus, args.rate, args.duration, args.concurrency, args.task, out)
+    server.shutdown()
+
+    summary = report(run, server, args)
+    summary["scenario"] = scenario
+    if args.json:
+        args.json.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.keep:
+        print(f"Pipeline log: {workdir / 'pipeline.log'}")
+    else:
+        os.chdir(SCRIPT_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,54 +11,135 @@ from urllib.parse import quote_plus
 import traceback
 from datetime import datetime
 import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from bs4 import BeautifulSoup
+from apkg_export import ApkgWriter
+from capped_download import download_capped, DownloadRejected
+from config_store import WatchedFile, parse_config, get_template
+from profiling import profile_job
+from prefetch import SpeculativeCache, GeminiQuota, watch_clipboard
+from gemini_cache import GeminiContextCache
+from anki_schema import AnkiSchema, is_schema_error
+from singleflight import SingleFlight
 # ================= CONFIG =================
 
 sys.stdout.reconfigure(encoding="utf-8")
 CONFIG_FILE = Path("./auto_anki_config.txt")
-def load_config():
-    if not CONFIG_FILE.exists():
-        print("auto_anki_config.txt not found")
-        input("Press Enter to exit...")
-        exit(1)
-
-    config = {}
-    for line in CONFIG_FILE.read_text(encoding="utf-8").splitlines():
-        line = line.strip()
-        if not line or line.startswith("#"):
-            continue
-        if "=" not in line:
-            continue
-        k, v = line.split("=", 1)
-        config[k.strip()] = v.strip()
-    return config
-
-config = load_config()
-
-ANKI_URL = config.get("ANKI_URL", "http://127.0.0.1:8765")
-# Task 1 defaults
-DECK_TASK1 = config.get("DECK_TASK1", "Review Task 1")
-MODEL_TASK1 = config.get("MODEL_TASK1", "IELTS Writing Revise")
-HOTKEY_TASK1 = config.get("HOTKEY_TASK1", "ctrl+alt+r")
-# Task 2 defaults
-DECK_TASK2 = config.get("DECK_TASK2", "Review Task 2")
-MODEL_TASK2 = config.get("MODEL_TASK2", "IELTS Writing Task 2")
-HOTKEY_TASK2 = config.get("HOTKEY_TASK2", "ctrl+alt+t")
-GEMINI_URL = config.get(
-    "GEMINI_URL",
-    "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-)
-GEMINI_API_KEY = config.get("GEMINI_API_KEY", "")
-PROMPT_FILE = Path(config.get("PROMPT_FILE", "./prompt.txt"))
-
-if not GEMINI_API_KEY:
-    print("GEMINI_API_KEY not set in auto_anki_config.txt")
+if not CONFIG_FILE.exists():
+    print("auto_anki_config.txt not found")
     input("Press Enter to exit...")
     exit(1)
 
+
+def read_settings(config: dict) -> dict:
+    """Derive the settings snapshot handed to each job from a parsed config file.
+
+    Raises on bad values, so a broken edit never replaces working settings.
+    """
+    settings = {
+        "ANKI_URL": config.get("ANKI_URL", "http://127.0.0.1:8765"),
+        # Task 1 defaults
+        "DECK_TASK1": config.get("DECK_TASK1", "Review Task 1"),
+        "MODEL_TASK1": config.get("MODEL_TASK1", "IELTS Writing Revise"),
+        "HOTKEY_TASK1": config.get("HOTKEY_TASK1", "ctrl+alt+r"),
+        # Task 2 defaults
+        "DECK_TASK2": config.get("DECK_TASK2", "Review Task 2"),
+        "MODEL_TASK2": config.get("MODEL_TASK2", "IELTS Writing Task 2"),
+        "HOTKEY_TASK2": config.get("HOTKEY_TASK2", "ctrl+alt+t"),
+        "GEMINI_URL": config.get(
+            "GEMINI_URL",
+            "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+        ),
+        "GEMINI_API_KEY": config.get("GEMINI_API_KEY", ""),
+        "PROMPT_FILE": Path(config.get("PROMPT_FILE", "./prompt.txt")),
+        # Upload the prompt's static prefix once as Gemini cached content
+        "GEMINI_CONTEXT_CACHE": config.get("GEMINI_CONTEXT_CACHE", "false").lower() == "true",
+        "GEMINI_CACHE_TTL": int(config.get("GEMINI_CACHE_TTL", "3600")),
+        # prefixes (estimated at ~4 chars/token) below the model's minimum are not uploaded
+        "GEMINI_CACHE_MIN_TOKENS": int(config.get("GEMINI_CACHE_MIN_TOKENS", "4096")),
+        "BING_IMAGES_URL": config.get("BING_IMAGES_URL", "https://www.bing.com/images/search"),
+        "APKG_WORKERS": int(config.get("APKG_WORKERS", "8")),
+        # Images larger than this are abandoned mid-download
+        "IMAGE_MAX_BYTES": int(config.get("IMAGE_MAX_BYTES", str(5 * 1024 * 1024))),
+        # Speculative Gemini call when a <...> sentence is copied
+        "PREFETCH": config.get("PREFETCH", "false").lower() == "true",
+        "PREFETCH_TTL": float(config.get("PREFETCH_TTL", "60")),
+        "PREFETCH_INTERVAL": float(config.get("PREFETCH_INTERVAL", "0.5")),
+        # requests/minute of the Gemini plan, and the share prefetch may use
+        "GEMINI_RPM": int(config.get("GEMINI_RPM", "15")),
+        "PREFETCH_GEMINI_SHARE": float(config.get("PREFETCH_GEMINI_SHARE", "0.3")),
+        # off|all|<fraction of jobs, e.g. 0.1>
+        "PROFILE": config.get("PROFILE", "off"),
+        "PROFILE_DIR": Path(config.get("PROFILE_DIR", "./profiles")),
+    }
+    if not settings["GEMINI_API_KEY"]:
+        raise ValueError("GEMINI_API_KEY not set in auto_anki_config.txt")
+    return settings
+
+
+def on_file_error(path, e):
+    log(f"Reload of {path} failed, keeping previous version: {e}", level="ERROR")
+
+
+CONFIG = WatchedFile(CONFIG_FILE, lambda text: read_settings(parse_config(text)), on_error=on_file_error)
+_config_lock = threading.Lock()
+_config_version = 0
+
+
+def refresh_config() -> dict:
+    """Return the latest settings (re-read if the file changed).
+
+    Every job takes one snapshot at its start and passes it down, so an edit
+    applies to the next card without a restart and never changes the settings
+    of a job already running. Treat the returned dict as read-only.
+    """
+    global _config_version
+    with _config_lock:
+        settings = CONFIG.get()
+        if CONFIG.version != _config_version:
+            if _config_version:
+                log(f"Config reloaded from {CONFIG_FILE}")
+                if (settings["HOTKEY_TASK1"], settings["HOTKEY_TASK2"]) != (HOTKEY_TASK1, HOTKEY_TASK2):
+                    log("HOTKEY_TASK1/HOTKEY_TASK2 changes take effect after restart", level="WARN")
+            _config_version = CONFIG.version
+        return settings
+
+
+# Startup values: hotkeys and the clipboard watcher are set up once.
+try:
+    STARTUP = refresh_config()
+    HOTKEY_TASK1 = STARTUP["HOTKEY_TASK1"]
+    HOTKEY_TASK2 = STARTUP["HOTKEY_TASK2"]
+except ValueError as e:
+    if __name__ != "__main__":
+        raise  # imported (e.g. by anki_server.py): let the caller decide
+    print(e)
+    input("Press Enter to exit...")
+    exit(1)
+
+# Set by --apkg: notes/media go into this package instead of AnkiConnect.
+APKG_WRITER = None
+
+# Set by --profile; overrides PROFILE from the config file.
+PROFILE_OVERRIDE = None
+
+PREFETCH_CACHE = SpeculativeCache()
+PREFETCH_QUOTA = GeminiQuota()
+GEMINI_CACHE = GeminiContextCache()
+
+# Decks / note types / fields known to AnkiConnect; jobs are checked against it.
+ANKI_SCHEMA = AnkiSchema()
+
+# Identical concurrent jobs / upstream requests share one in-flight call.
+JOBS = SingleFlight()
+FETCHES = SingleFlight()
+
 # ==========================================
 
-def anki(action, params=None):
+def anki(cfg, action, params=None):
     payload = {
         "action": action,
         "version": 6,
@@ -66,7 +147,7 @@ def anki(action, params=None):
     }
     try:
         log(f"ANKI request action={action} params_keys={list((params or {}).keys())}")
-        r = requests.post(ANKI_URL, json=payload, timeout=15)
+        r = requests.post(cfg["ANKI_URL"], json=payload, timeout=15)
     except Exception as e:
         log(f"ANKI request failed: {e}", level="ERROR")
         log_exception(e)
@@ -86,15 +167,21 @@ def anki(action, params=None):
     return res["result"]
 
 
-def load_prompt(user_input: str) -> str:
-    base = PROMPT_FILE.read_text(encoding="utf-8")
-    return base.replace("{{INPUT}}", user_input)
+def load_prompt(cfg, user_input: str) -> str:
+    template = get_template(cfg["PROMPT_FILE"], on_error=on_file_error)
+    return template.render(INPUT=user_input)
+
 
+def call_gemini(cfg, prompt: str) -> str:
+    text, _ = FETCHES.do(("gemini", cfg["GEMINI_URL"], prompt), lambda: _call_gemini(cfg, prompt))
+    return text
 
-def call_gemini(prompt: str) -> str:
+
+def _call_gemini(cfg, prompt: str) -> str:
+    url = cfg["GEMINI_URL"]
     headers = {
         "Content-Type": "application/json",
-        "X-goog-api-key": GEMINI_API_KEY
+        "X-goog-api-key": cfg["GEMINI_API_KEY"]
     }
 
     payload = {
@@ -107,14 +194,34 @@ def call_gemini(prompt: str) -> str:
         ]
     }
 
+    # Send only the per-item tail when the static prefix is in Gemini's context cache
+    cached = None
+    if cfg["GEMINI_CONTEXT_CACHE"]:
+        prefix = get_template(cfg["PROMPT_FILE"], on_error=on_file_error).static_prefix("INPUT")
+        if prefix and prompt.startswith(prefix):
+            cached = GEMINI_CACHE.cached_content(
+                "ielts", url, cfg["GEMINI_API_KEY"], prefix, cfg["GEMINI_CACHE_TTL"],
+                log, cfg["GEMINI_CACHE_MIN_TOKENS"])
+
     try:
-        log(f"Calling Gemini (prompt length={len(prompt)})")
-        r = requests.post(
-            GEMINI_URL,
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
+        if cached:
+            log(f"Calling Gemini with cached prefix {cached} (input length={len(prompt) - len(prefix)})")
+            r = requests.post(url, headers=headers, timeout=30, json={
+                "cachedContent": cached,
+                "contents": [{"role": "user", "parts": [{"text": prompt[len(prefix):]}]}]
+            })
+            if r.status_code in (400, 403, 404):
+                log(f"Gemini rejected cached content ({r.status_code}), sending full prompt", level="WARN")
+                GEMINI_CACHE.invalidate("ielts")
+                cached = None
+        if not cached:
+            log(f"Calling Gemini (prompt length={len(prompt)})")
+            r = requests.post(
+                url,
+                headers=headers,
+                json=payload,
+                timeout=30
+            )
     except Exception as e:
         log(f"Gemini request failed: {e}", level="ERROR")
         log_exception(e)
@@ -168,15 +275,21 @@ def parse_output(text: str):
     }
 
 
-def fetch_image_for_phrase(phrase: str, max_retries: int = 10):
+def fetch_image_for_phrase(cfg, phrase: str, max_retries: int = 10):
     """Search Bing Images for `phrase` and return (filename, bytes) or (None, None).
     Attempts up to `max_retries` distinct image URLs found on the search page.
     """
+    result, _ = FETCHES.do(("bing", cfg["BING_IMAGES_URL"], phrase, max_retries),
+                           lambda: _fetch_image_for_phrase(cfg, phrase, max_retries))
+    return result
+
+
+def _fetch_image_for_phrase(cfg, phrase: str, max_retries: int = 10):
     if not phrase:
         return None, None
 
     query = quote_plus(phrase)
-    search_url = f"https://www.bing.com/images/search?q={query}&form=HDRSC2"
+    search_url = f"{cfg['BING_IMAGES_URL']}?q={query}&form=HDRSC2"
     headers = {"User-Agent": "Mozilla/5.0"}
     try:
         log(f"Searching images for phrase: {phrase}")
@@ -233,31 +346,57 @@ def fetch_image_for_phrase(phrase: str, max_retries: int = 10):
         tried += 1
         log(f"Trying image #{tried}: {img_url}")
         try:
-            ir = requests.get(img_url, headers=headers, timeout=10)
-            if ir.status_code == 200:
-                ctype = ir.headers.get("Content-Type", "")
-                log(f"Image response content-type: {ctype}")
-                if ctype.startswith("image") and ir.content:
-                    # try to compute extension
-                    ext = ".jpg"
-                    if "png" in ctype:
-                        ext = ".png"
-                    elif "gif" in ctype:
-                        ext = ".gif"
-                    # safe filename
-                    safe_name = re.sub(r"[^0-9A-Za-z._-]", "_", phrase)[:60]
-                    filename = f"{safe_name}{ext}"
-                    return filename, ir.content
+            content, ext = download_capped(img_url, headers, cfg["IMAGE_MAX_BYTES"])
+            log(f"Image downloaded: {ext}, {len(content)} bytes")
+            # safe filename
+            safe_name = re.sub(r"[^0-9A-Za-z._-]", "_", phrase)[:60]
+            filename = f"{safe_name}.{ext}"
+            return filename, content
+        except DownloadRejected as e:
+            log(f"Image rejected: {e}", level="DEBUG")
+            continue
         except Exception:
             log(f"Failed to fetch image URL: {img_url}", level="DEBUG")
             continue
 
     return None, None
 
-def add_note(fields):
+NOTE_FIELDS = ["Sentence", "Cloze", "Answer", "Definition", "Image"]
+
+
+def task_target(cfg, task: int):
+    if task == 1:
+        return cfg["DECK_TASK1"], cfg["MODEL_TASK1"]
+    return cfg["DECK_TASK2"], cfg["MODEL_TASK2"]
+
+
+def check_schema(cfg, task: int) -> list[str]:
+    """Problems with the task's deck / model / NOTE_FIELDS, from the cached schema."""
+    if APKG_WRITER is not None:
+        return []
+    deck, model = task_target(cfg, task)
+    return ANKI_SCHEMA.validate(partial(anki, cfg), deck, model, NOTE_FIELDS)
+
+
+def probe_anki(cfg):
+    """Fetch the schema once at startup and report anything that would make
+    addNote fail. Anki not running yet is only a warning."""
+    try:
+        info = ANKI_SCHEMA.probe(partial(anki, cfg), [cfg["MODEL_TASK1"], cfg["MODEL_TASK2"]])
+    except Exception as e:
+        log(f"AnkiConnect not reachable yet: {e}", level="WARN")
+        return
+    log(f"AnkiConnect v{info['version']}: {len(info['decks'])} decks, {len(info['models'])} note types")
+    for task in (1, 2):
+        deck, model = task_target(cfg, task)
+        for problem in ANKI_SCHEMA.problems(info, deck, model, NOTE_FIELDS):
+            log(f"Task {task}: {problem}", level="ERROR")
+
+
+def add_note(cfg, fields):
     # default to task1 deck/model unless overridden in fields (caller will pass correct deck/model)
-    deck = fields.pop("_deck", DECK_TASK1)
-    model = fields.pop("_model", MODEL_TASK1)
+    deck = fields.pop("_deck", cfg["DECK_TASK1"])
+    model = fields.pop("_model", cfg["MODEL_TASK1"])
     log(f"Adding note: deck={deck} model={model} image_present={'_image_bytes' in fields}")
 
     note = {
@@ -277,6 +416,15 @@ def add_note(fields):
     # If image bytes were provided, include them for Anki to save and insert into the Image field
     image_bytes = fields.get("_image_bytes")
     image_filename = fields.get("_image_filename")
+    if APKG_WRITER is not None:
+        if APKG_WRITER.has_note(model, note["fields"]["Sentence"]):
+            log(f"add_note: duplicate sentence skipped for deck={deck}")
+            return
+        if image_bytes and image_filename:
+            APKG_WRITER.add_media(image_filename, image_bytes)
+        APKG_WRITER.add_note(deck, model, note["fields"], note["tags"])
+        log(f"add_note: written to package for deck={deck} model={model}")
+        return
     if image_bytes and image_filename:
         b64 = base64.b64encode(image_bytes).decode("ascii")
         note["picture"] = [{
@@ -285,11 +433,13 @@ def add_note(fields):
             "fields": ["Image"]
         }]
     try:
-        anki("addNote", {"note": note})
+        anki(cfg, "addNote", {"note": note})
         log(f"add_note: success for deck={deck} model={model}")
     except Exception as e:
         log(f"add_note: failed to add note to Anki: {e}", level="ERROR")
         log_exception(e)
+        if is_schema_error(str(e)):
+            ANKI_SCHEMA.invalidate()
         raise
 
 busy = False
@@ -314,33 +464,97 @@ def on_hotkey_for_task(task: int = 1):
 
 def process_clipboard(task: int = 1):
     time.sleep(1.5)
-    text = pyperclip.paste().strip()
+    cfg = refresh_config()
+    text = pyperclip.paste()
+    with profile_job(f"ielts_task{task}_{text}", cfg["PROFILE_DIR"], PROFILE_OVERRIDE or cfg["PROFILE"], log):
+        create_sentence_card(text, task, cfg)
 
-    if "<" not in text or ">" not in text:
-        log("Input must contain <target phrase>")
+
+def prefetch_sentence(cfg, text: str):
+    """Speculative Gemini call + parse for a copied <...> sentence, within the
+    configured share of the Gemini quota. Returns parsed fields or None."""
+    if not PREFETCH_QUOTA.try_acquire(cfg["GEMINI_RPM"], cfg["PREFETCH_GEMINI_SHARE"]):
+        log("Prefetch skipped: speculative Gemini share used up", level="DEBUG")
+        return None
+    result = call_gemini(cfg, load_prompt(cfg, text))
+    return parse_output(result) if result else None
+
+
+def looks_like_marked_sentence(text: str) -> bool:
+    """One <target phrase> made of words, with at least a few words of prose
+    around it, so copied HTML/XML snippets don't spend the Gemini share."""
+    m = re.fullmatch(r"([^<>]*)<([^<>]+)>([^<>]*)", text, re.S)
+    if not m or len(text) > 1000:
+        return False
+    before, phrase, after = m.groups()
+    if not re.fullmatch(r"[^\W\d_][\w\s'’,-]*", phrase.strip()):
+        return False
+    return len(re.findall(r"[^\W\d_]+", f"{before} {after}")) >= 3
+
+
+def on_clipboard_change(text: str):
+    cfg = refresh_config()
+    if not cfg["PREFETCH"]:
+        return
+    text = text.strip()
+    if not looks_like_marked_sentence(text):
         return
+    if PREFETCH_CACHE.submit(text, lambda: prefetch_sentence(cfg, text), cfg["PREFETCH_TTL"]):
+        log("Prefetching Gemini output for copied sentence", level="DEBUG")
 
-    prompt = load_prompt(text)
-    result = call_gemini(prompt)
 
-    if not result:
-        return  # stop here, no retry
+def create_sentence_card(text: str, task: int = 1, cfg: dict | None = None) -> str:
+    """Run the IELTS pipeline for `text` and add the note, with the settings
+    snapshot `cfg` (default: the current config).
 
-    fields = parse_output(result)
+    Returns a short status: "added", "joined", "invalid", "schema_error" or
+    "rate_limited". Concurrent calls for the same sentence and task share one
+    run; the callers that joined it get "joined" instead of "added".
+    """
+    cfg = cfg or refresh_config()
+    text = text.strip()
 
-    # determine deck/model based on task
-    if task == 1:
-        fields["_deck"] = DECK_TASK1
-        fields["_model"] = MODEL_TASK1
-        fields["tags"] = ["task1", "ielts"]
+    if "<" not in text or ">" not in text:
+        log("Input must contain <target phrase>")
+        return "invalid"
+
+    problems = check_schema(cfg, task)
+    if problems:
+        for problem in problems:
+            log(problem, level="ERROR")
+        return "schema_error"
+
+    key = ("ielts", task, " ".join(text.split()))
+    status, shared = JOBS.do(key, lambda: sentence_pipeline(cfg, text, task))
+    if shared:
+        log(f"Joined in-flight task {task} job ({status})")
+        if status == "added":
+            return "joined"
+    return status
+
+
+def sentence_pipeline(cfg, text: str, task: int) -> str:
+    # Gemini output fetched when the sentence was copied (if any)
+    fields = PREFETCH_CACHE.take(text, timeout=30) if cfg["PREFETCH"] else None
+    if fields:
+        log("Using prefetched Gemini output")
+        fields = dict(fields)
     else:
-        fields["_deck"] = DECK_TASK2
-        fields["_model"] = MODEL_TASK2
-        fields["tags"] = ["task2", "ielts"]
+        prompt = load_prompt(cfg, text)
+        result = call_gemini(cfg, prompt)
+
+        if not result:
+            return "rate_limited"  # stop here, no retry
+
+        fields = parse_output(result)
+
+    # determine deck/model based on task
+    fields["_deck"], fields["_model"] = task_target(cfg, task)
+    fields["tags"] = [f"task{task}", "ielts"]
 
     # Try to fetch an illustration: prefer explicit Image label, else use Answer
     image_search = fields.get("Image") or fields.get("Answer")
-    filename, img_bytes = fetch_image_for_phrase(image_search, max_retries=10)
+    filename, img_bytes = fetch_image_for_phrase(cfg, image_search, max_retries=10)
     if filename and img_bytes:
         # insert HTML tag into Image field and pass bytes for attachment
         fields["Image"] = f"<img src=\"{filename}\">"
@@ -349,8 +563,49 @@ def process_clipboard(task: int = 1):
 
     # capture deck name before add_note pops it
     deck_name = fields.get("_deck")
-    add_note(fields)
+    add_note(cfg, fields)
     log(f"Added IELTS sentence card to {deck_name}")
+    return "added"
+
+
+def export_apkg(sentences_file: Path, out_path: Path, task: int = 1, workers: int | None = None):
+    """Build IELTS cards for every `<...>` line of `sentences_file` into
+    `out_path` (.apkg), without AnkiConnect.
+    """
+    global APKG_WRITER
+
+    cfg = refresh_config()
+    workers = workers or cfg["APKG_WORKERS"]
+    sentences = []
+    for line in sentences_file.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            sentences.append(line)
+
+    log(f"Exporting {len(sentences)} sentences (task {task}) to {out_path} ({workers} workers)")
+    counts = {}
+    started = time.monotonic()
+
+    def run(sentence):
+        try:
+            return create_sentence_card(sentence, task, cfg)
+        except Exception as e:
+            log(f"Failed [{sentence[:60]}]: {e}", level="ERROR")
+            return "failed"
+
+    with ApkgWriter(out_path) as writer:
+        APKG_WRITER = writer
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                for i, status in enumerate(pool.map(run, sentences), start=1):
+                    counts[status] = counts.get(status, 0) + 1
+                    if i % 100 == 0:
+                        log(f"Progress: {i}/{len(sentences)}")
+        finally:
+            APKG_WRITER = None
+
+    log(f"Export done in {time.monotonic() - started:.1f}s: {counts}")
+    return counts
 
 def log(msg):
     print(f"[AUTO-ANKI] {msg}", flush=True)
@@ -365,6 +620,26 @@ def log_exception(e: Exception):
     print(f"[AUTO-ANKI] {datetime.now().isoformat()} ERROR: {e}\n{tb}", flush=True)
 
 def main():
+    global PROFILE_OVERRIDE
+
+    parser = argparse.ArgumentParser(description="Auto Anki – IELTS Writing Helper")
+    parser.add_argument("--profile", metavar="MODE", nargs="?", const="all",
+                        help="profile hotkey jobs: 'all' (default) or a sampling fraction like 0.1")
+    parser.add_argument("--apkg", metavar="OUT.apkg", type=Path,
+                        help="write cards for SENTENCES_FILE into an .apkg instead of using AnkiConnect")
+    parser.add_argument("--task", type=int, choices=(1, 2), default=1,
+                        help="deck/model set used with --apkg")
+    parser.add_argument("sentences_file", nargs="?", type=Path,
+                        help="one <...> sentence per line (used with --apkg)")
+    args = parser.parse_args()
+    PROFILE_OVERRIDE = args.profile
+
+    if args.apkg:
+        if not args.sentences_file:
+            parser.error("--apkg requires SENTENCES_FILE")
+        export_apkg(args.sentences_file, args.apkg, args.task)
+        return
+
     log("===================================")
     log("Auto Anki – IELTS Writing Helper")
     log(f"Hotkey Task1: {HOTKEY_TASK1}")
@@ -376,7 +651,13 @@ def main():
     log("Close this window to stop")
     log("===================================")
 
+    probe_anki(STARTUP)
+
     # register both task hotkeys
+    if STARTUP["PREFETCH"]:
+        log("Prefetch: watching clipboard")
+        watch_clipboard(pyperclip.paste, on_clipboard_change, STARTUP["PREFETCH_INTERVAL"], log)
+
     keyboard.add_hotkey(HOTKEY_TASK1, lambda: on_hotkey_for_task(1))
     keyboard.add_hotkey(HOTKEY_TASK2, lambda: on_hotkey_for_task(2))
     keyboard.wait()
@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class GeminiQuota:
+    """Sliding one-minute window of speculative Gemini calls.
+
+    Speculative work may use at most `share` of the `rpm` quota; calls made for
+    an actual hotkey press are never limited here.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = deque()
+
+    def try_acquire(self, rpm: int, share: float) -> bool:
+        allowed = int(rpm * share)
+        now = time.monotonic()
+        with self._lock:
+            while self._calls and now - self._calls[0] > 60:
+                self._calls.popleft()
+            if len(self._calls) >= allowed:
+                return False
+            self._calls.append(now)
+            return True
+
+
+class SpeculativeCache:
+    """Short-lived results of read-only pipeline stages, keyed by clipboard text.
+
+    `submit()` starts the work in the background; `take()` hands the result to
+    the hotkey job (waiting if it is still running) and removes it, so every
+    prefetch is used at most once.
+    """
+
+    def __init__(self, workers: int = 2):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _expire(self, now):
+        for key in [k for k, (_, expires) in self._entries.items() if expires < now]:
+            del self._entries[key]
+
+    def submit(self, key: str, fn, ttl: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if key in self._entries:
+                return False
+            self._entries[key] = (self._pool.submit(fn), now + ttl)
+            return True
+
+    def take(self, key: str, timeout: float):
+        """Return the prefetched result, or None if missing, expired or failed."""
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        try:
+            return entry[0].result(timeout=timeout)
+        except Exception:
+            # still running after `timeout`, or the prefetch itself failed
+            return None
+
+
+def watch_clipboard(paste, on_change, interval: float, log=None):
+    """Poll the clipboard from a daemon thread and call `on_change(text)` for
+    every new value."""
+
+    def loop():
+        last = None
+        while True:
+            try:
+                text = paste()
+                if text != last:
+                    last = text
+                    on_change(text)
+            except Exception as e:
+                if log:
+                    log(f"Clipboard watcher: {e}", level="DEBUG")
+            time.sleep(interval)
+
+    t = threading.Thread(target=loop, name="clipboard-watcher", daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,56 @@
+import argparse
+import json
+import pstats
+from pathlib import Path
+
+
+def load_jobs(profile_dir: Path):
+    jobs = []
+    for meta_path in profile_dir.glob("*.json"):
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except Exception:
+            continue
+        meta["_base"] = meta_path.with_suffix("")
+        jobs.append(meta)
+    jobs.sort(key=lambda j: j.get("wall_s", 0), reverse=True)
+    return jobs
+
+
+def top_functions(prof_path: Path, limit: int):
+    """Return [(tottime, cumtime, calls, "file:line(func)")] sorted by own time."""
+    stats = pstats.Stats(str(prof_path)).stats
+    rows = []
+    for (filename, line, func), (_, ncalls, tottime, cumtime, _) in stats.items():
+        rows.append((tottime, cumtime, ncalls, f"{Path(filename).name}:{line}({func})"))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank profiled Auto Anki jobs")
+    parser.add_argument("profile_dir", nargs="?", default="profiles", type=Path)
+    parser.add_argument("--jobs", type=int, default=10, help="how many of the slowest jobs to show")
+    parser.add_argument("--functions", type=int, default=8, help="top functions per job")
+    args = parser.parse_args()
+
+    jobs = load_jobs(args.profile_dir)
+    if not jobs:
+        print(f"No profiles found in {args.profile_dir}")
+        return
+
+    print(f"{len(jobs)} profiled jobs in {args.profile_dir}, slowest first\n")
+    for job in jobs[:args.jobs]:
+        print(f"{job.get('wall_s', 0):8.2f}s wall {job.get('cpu_s', 0):7.2f}s cpu "
+              f"{job.get('peak_bytes', 0) / 1024:9.0f} KiB peak  {job.get('job')}"
+              f"{'  [' + job['error'] + ']' if job.get('error') else ''}")
+        prof_path = Path(f"{job['_base']}.prof")
+        if not prof_path.exists():
+            continue
+        for tottime, cumtime, calls, where in top_functions(prof_path, args.functions):
+            print(f"           {tottime:8.3f}s own {cumtime:8.3f}s cum {calls:8d}x  {where}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
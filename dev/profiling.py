@@ -0,0 +1,94 @@
+import cProfile
+import json
+import random
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# cProfile and tracemalloc are process-wide, so only one job is profiled at a
+# time; jobs that overlap a profiled one simply run unprofiled.
+_profile_lock = threading.Lock()
+
+
+def should_profile(mode) -> bool:
+    """`mode` is "off", "all", or a sampling fraction such as "0.1"."""
+    mode = str(mode or "off").strip().lower()
+    if mode in ("", "off", "false", "0"):
+        return False
+    if mode in ("all", "on", "true"):
+        return True
+    try:
+        return random.random() < float(mode)
+    except ValueError:
+        return False
+
+
+def job_slug(text: str) -> str:
+    return re.sub(r"[^0-9A-Za-z_-]+", "_", text.strip())[:40].strip("_") or "job"
+
+
+@contextmanager
+def profile_job(job_name: str, out_dir, mode, log=None):
+    """Run the body under cProfile + tracemalloc when `mode` selects it.
+
+    Writes `<stamp>_<job>.prof` (pstats), `<stamp>_<job>.snapshot`
+    (tracemalloc snapshot at the end of the job) and `<stamp>_<job>.json`
+    (wall/CPU time, traced memory peak, top allocation sites) into `out_dir`.
+    """
+    if not should_profile(mode) or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+
+    try:
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        started = datetime.now()
+        base = out_dir / f"{started.strftime('%Y%m%d-%H%M%S-%f')}_{job_slug(job_name)}"
+
+        own_tracing = not tracemalloc.is_tracing()
+        if own_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+
+        profiler = cProfile.Profile()
+        error = None
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        profiler.enable()
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            profiler.disable()
+            wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if own_tracing:
+                tracemalloc.stop()
+
+            profiler.dump_stats(f"{base}.prof")
+            snapshot.dump(f"{base}.snapshot")
+            top_allocs = [{
+                "where": str(stat.traceback),
+                "size": stat.size,
+                "count": stat.count,
+            } for stat in snapshot.statistics("lineno")[:10]]
+            Path(f"{base}.json").write_text(json.dumps({
+                "job": job_name,
+                "started": started.isoformat(),
+                "wall_s": round(wall, 4),
+                "cpu_s": round(cpu, 4),
+                "peak_bytes": peak,
+                "error": error,
+                "top_allocations": top_allocs,
+            }, ensure_ascii=False, indent=2), encoding="utf-8")
+            if log:
+                log(f"Profiled {job_name!r}: {wall:.2f}s wall, {cpu:.2f}s CPU, "
+                    f"peak {peak / 1024:.0f} KiB -> {base}.prof")
+    finally:
+        _profile_lock.release()
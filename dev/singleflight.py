@@ -0,0 +1,39 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key.
+
+    The first caller for a key runs `fn`; callers arriving while it is still
+    running wait for it and get the same result (or exception). Nothing is
+    cached afterwards: the next call with that key runs `fn` again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Return `(result, shared)`; `shared` is True for callers that joined
+        another caller's in-flight call."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
@@ -7,11 +7,23 @@ import re
 import hashlib
 import json
 import base64
-from urllib.parse import urlparse, unquote
 from bs4 import BeautifulSoup
 import sys
+import argparse
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urljoin
+from functools import partial
 from datetime import datetime
+from apkg_export import ApkgWriter
+from capped_download import download_capped, sniff_mp3, DownloadRejected
+from config_store import WatchedFile, parse_config, get_template
+from profiling import profile_job
+from prefetch import SpeculativeCache, watch_clipboard
+from gemini_cache import GeminiContextCache
+from anki_schema import AnkiSchema, is_schema_error
+from singleflight import SingleFlight
 
 CONFIG_FILE = Path("./auto_anki_config.txt")
 sys.stdout.reconfigure(encoding="utf-8")
@@ -21,49 +33,136 @@ if not CONFIG_FILE.exists():
     input("Press Enter to exit...")
     exit(1)
 
-config = {}
 
-def load_config():
-    for line in CONFIG_FILE.read_text(encoding="utf-8").splitlines():
-        line = line.strip()
-        if not line or line.startswith("#"):
-            continue
-        if "=" not in line:
-            continue
-        k, v = line.split("=", 1)
-        config[k.strip()] = v.strip()
-    return config
+def read_settings(config: dict) -> dict:
+    """Derive the settings snapshot handed to each job from a parsed config file.
+
+    Raises on bad values, so a broken edit never replaces working settings.
+    """
+    return {
+        "ANKI_URL": config.get("ANKI_URL", "http://127.0.0.1:8765"),
+        "DECK": config.get("DECK", "Default"),
+        "MODEL": config.get("MODEL", "Basic"),
+        "HOTKEY": config.get("HOTKEY", "ctrl+alt+a"),
+        "ALLOW_DUPLICATE": config.get("ALLOW_DUPLICATE", "true").lower() == "true",
+
+        # ---------- Vocab (Gemini + languages) ----------
+        "VOCAB_SOURCE": config.get("VOCAB_SOURCE", "hybrid").strip().lower(),  # cambridge|gemini|hybrid
+        "PHRASE_MAX_WORDS_CAMBRIDGE": int(config.get("PHRASE_MAX_WORDS_CAMBRIDGE", "5")),
+        "SOURCE_LANG": config.get("SOURCE_LANG", "en").strip().lower(),
+        "TARGET_LANGS": [x.strip() for x in config.get("TARGET_LANGS", "vi").split(",") if x.strip()],
+
+        "VOCAB_GEMINI_URL": (config.get("VOCAB_GEMINI_URL") or config.get(
+            "GEMINI_URL",
+            "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+        )).strip(),
+        "VOCAB_GEMINI_API_KEY": (config.get("VOCAB_GEMINI_API_KEY") or config.get("GEMINI_API_KEY", "")).strip(),
+        "VOCAB_PROMPT_FILE": Path(config.get("VOCAB_PROMPT_FILE", "./vocab_prompt.txt")),
+        # Upload the prompt's static prefix once as Gemini cached content
+        "GEMINI_CONTEXT_CACHE": config.get("GEMINI_CONTEXT_CACHE", "false").lower() == "true",
+        "GEMINI_CACHE_TTL": int(config.get("GEMINI_CACHE_TTL", "3600")),
+        # prefixes (estimated at ~4 chars/token) below the model's minimum are not uploaded
+        "GEMINI_CACHE_MIN_TOKENS": int(config.get("GEMINI_CACHE_MIN_TOKENS", "4096")),
+
+        # Hybrid mode: start Gemini if Cambridge hasn't answered within HEDGE_DEADLINE s
+        # (immediately for terms Cambridge missed before)
+        "HEDGE": config.get("HEDGE", "true").lower() == "true",
+        "HEDGE_DEADLINE": float(config.get("HEDGE_DEADLINE", "2.0")),
+        # once Gemini wins, how long to still wait for a preferred Cambridge answer
+        "HEDGE_GRACE": float(config.get("HEDGE_GRACE", "0.5")),
+        "HEDGE_MISS_FILE": Path(config.get("HEDGE_MISS_FILE", "./cambridge_misses.json")),
+
+        # Upstream endpoints (overridable, e.g. by loadtest.py stand-ins)
+        "CAMBRIDGE_URL": config.get("CAMBRIDGE_URL", "https://dictionary.cambridge.org/dictionary/english/"),
+        "BING_IMAGES_URL": config.get("BING_IMAGES_URL", "https://www.bing.com/images/search"),
+
+        # Pronunciation audio from the Cambridge page (uk|us), cached on disk by term and accent
+        "FETCH_AUDIO": config.get("FETCH_AUDIO", "true").lower() == "true",
+        "AUDIO_ACCENT": config.get("AUDIO_ACCENT", "uk").strip().lower(),
+        "AUDIO_CACHE_DIR": Path(config.get("AUDIO_CACHE_DIR", "./audio_cache")),
+        "AUDIO_MAX_BYTES": int(config.get("AUDIO_MAX_BYTES", str(1024 * 1024))),
+        # When Gemini wins the hedge, the audio stage waits this long for the
+        # abandoned Cambridge page to get the pronunciation URL
+        "HEDGE_AUDIO_WAIT": float(config.get("HEDGE_AUDIO_WAIT", "5.0")),
+
+        # Images larger than this are abandoned mid-download
+        "IMAGE_MAX_BYTES": int(config.get("IMAGE_MAX_BYTES", str(5 * 1024 * 1024))),
+
+        # ---------- Offline .apkg export ----------
+        "APKG_WORKERS": int(config.get("APKG_WORKERS", "8")),
+
+        # ---------- Speculative prefetch on clipboard change ----------
+        "PREFETCH": config.get("PREFETCH", "false").lower() == "true",
+        "PREFETCH_TTL": float(config.get("PREFETCH_TTL", "60")),
+        "PREFETCH_INTERVAL": float(config.get("PREFETCH_INTERVAL", "0.5")),
+
+        # ---------- Profiling ----------
+        "PROFILE": config.get("PROFILE", "off"),  # off|all|<fraction of jobs, e.g. 0.1>
+        "PROFILE_DIR": Path(config.get("PROFILE_DIR", "./profiles")),
+    }
+
+
+def on_file_error(path, e):
+    log(f"Reload of {path} failed, keeping previous version: {e}", level="ERROR")
+
+
+CONFIG = WatchedFile(CONFIG_FILE, lambda text: read_settings(parse_config(text)), on_error=on_file_error)
+_config_lock = threading.Lock()
+_config_version = 0
+
+
+def refresh_config() -> dict:
+    """Return the latest settings (re-read if the file changed).
+
+    Every job takes one snapshot at its start and passes it down, so an edit
+    applies to the next card without a restart and never changes the settings
+    of a job already running. Treat the returned dict as read-only.
+    """
+    global _config_version
+    with _config_lock:
+        settings = CONFIG.get()
+        if CONFIG.version != _config_version:
+            if _config_version:
+                log(f"Config reloaded from {CONFIG_FILE}")
+                if settings["HOTKEY"] != HOTKEY:
+                    log("HOTKEY change takes effect after restart", level="WARN")
+            _config_version = CONFIG.version
+        return settings
+
 
-config = load_config()
+# Startup values: the hotkey and clipboard watcher are set up once.
+STARTUP = refresh_config()
+HOTKEY = STARTUP["HOTKEY"]
 
-ANKI_URL = config.get("ANKI_URL", "http://127.0.0.1:8765")
-DECK = config.get("DECK", "Default")
-MODEL = config.get("MODEL", "Basic")
-HOTKEY = config.get("HOTKEY", "ctrl+alt+a")
-ALLOW_DUPLICATE = config.get("ALLOW_DUPLICATE", "true").lower() == "true"
+# Set by --apkg: notes/media go into this package instead of AnkiConnect.
+APKG_WRITER = None
 
-# ---------- Vocab (Gemini + languages) ----------
-VOCAB_SOURCE = config.get("VOCAB_SOURCE", "hybrid").strip().lower()  # cambridge|gemini|hybrid
-PHRASE_MAX_WORDS_CAMBRIDGE = int(config.get("PHRASE_MAX_WORDS_CAMBRIDGE", "5"))
-SOURCE_LANG = config.get("SOURCE_LANG", "en").strip().lower()
-TARGET_LANGS = [x.strip() for x in config.get("TARGET_LANGS", "vi").split(",") if x.strip()]
+# Set by --profile; overrides PROFILE from the config file.
+PROFILE_OVERRIDE = None
 
-VOCAB_GEMINI_URL = (config.get("VOCAB_GEMINI_URL") or config.get(
-    "GEMINI_URL",
-    "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-)).strip()
-VOCAB_GEMINI_API_KEY = (config.get("VOCAB_GEMINI_API_KEY") or config.get("GEMINI_API_KEY", "")).strip()
-VOCAB_PROMPT_FILE = Path(config.get("VOCAB_PROMPT_FILE", "./vocab_prompt.txt"))
+PREFETCH_CACHE = SpeculativeCache()
+
+GEMINI_CACHE = GeminiContextCache()
+
+# Decks / note types / fields known to AnkiConnect; jobs are checked against it.
+ANKI_SCHEMA = AnkiSchema()
+
+# Identical concurrent jobs / upstream requests share one in-flight call.
+JOBS = SingleFlight()
+FETCHES = SingleFlight()
+
+# Runs independent per-card stages (e.g. audio) alongside the image stage.
+STAGE_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="stage")
 
 
 # ---------- Anki ----------
-def anki(action, params=None):
+def anki(cfg, action, params=None):
     payload = {
         "action": action,
         "version": 6,
         "params": params or {}
     }
-    r = requests.post(ANKI_URL, json=payload)
+    r = requests.post(cfg["ANKI_URL"], json=payload)
     r.raise_for_status()
     res = r.json()
     if res.get("error"):
@@ -71,24 +170,60 @@ def anki(action, params=None):
     return res["result"]
 
 
-def note_exists(word):
+def note_exists(cfg, word):
+    if APKG_WRITER is not None:
+        return APKG_WRITER.has_note(cfg["MODEL"], word)
     query = f'Word:"{word}"'
-    return len(anki("findNotes", {"query": query})) > 0
+    return len(anki(cfg, "findNotes", {"query": query})) > 0
+
+
+NOTE_FIELDS = ["Word", "Cloze", "Phonetic symbol", "Audio", "Definition",
+               "Extra information", "Synonyms", "Image"]
+
+
+def check_schema(cfg) -> list[str]:
+    """Problems with DECK / MODEL / NOTE_FIELDS, from the cached schema."""
+    if APKG_WRITER is not None:
+        return []
+    return ANKI_SCHEMA.validate(partial(anki, cfg), cfg["DECK"], cfg["MODEL"], NOTE_FIELDS)
+
+
+def probe_anki(cfg):
+    """Fetch the schema once at startup and report anything that would make
+    addNote fail. Anki not running yet is only a warning."""
+    try:
+        info = ANKI_SCHEMA.probe(partial(anki, cfg), [cfg["MODEL"]])
+    except Exception as e:
+        log(f"AnkiConnect not reachable yet: {e}", level="WARN")
+        return
+    log(f"AnkiConnect v{info['version']}: {len(info['decks'])} decks, {len(info['models'])} note types")
+    for problem in ANKI_SCHEMA.problems(info, cfg["DECK"], cfg["MODEL"], NOTE_FIELDS):
+        log(problem, level="ERROR")
+
+
+def store_media(cfg, filename: str, data: bytes):
+    if APKG_WRITER is not None:
+        APKG_WRITER.add_media(filename, data)
+        return
+    anki(cfg, "storeMediaFile", {
+        "filename": filename,
+        "data": base64.b64encode(data).decode('ascii')
+    })
 
 
-def add_note(data):
+def add_note(cfg, data):
     word = data["word"].strip()
     cloze = make_cloze(word)
     tags = data.get("tags") or ["vocab"]
 
     note = {
-        "deckName": DECK,
-        "modelName": MODEL,
+        "deckName": cfg["DECK"],
+        "modelName": cfg["MODEL"],
         "fields": {
             "Word": word,
             "Cloze": cloze,
             "Phonetic symbol": data.get("ipa", ""),
-            "Audio": "",
+            "Audio": data.get("audio", ""),
             "Definition": data.get("definition", ""),
             "Extra information": data.get("examples", ""),
             "Synonyms": data.get("synonyms", ""),
@@ -96,11 +231,20 @@ def add_note(data):
         },
         "tags": tags,
         "options": {
-            "allowDuplicate": ALLOW_DUPLICATE
+            "allowDuplicate": cfg["ALLOW_DUPLICATE"]
         }
     }
 
-    anki("addNote", {"note": note})
+    if APKG_WRITER is not None:
+        APKG_WRITER.add_note(cfg["DECK"], cfg["MODEL"], note["fields"], tags)
+        return
+
+    try:
+        anki(cfg, "addNote", {"note": note})
+    except Exception as e:
+        if is_schema_error(str(e)):
+            ANKI_SCHEMA.invalidate()
+        raise
 
 def make_cloze(text: str) -> str:
     parts = text.split()
@@ -115,8 +259,14 @@ def make_cloze_word(word):
 
 
 # ---------- Cambridge ----------
-def fetch_cambridge(word):
-    url = f"https://dictionary.cambridge.org/dictionary/english/{word.replace(' ', '-')}"
+def fetch_cambridge(cfg, word):
+    key = ("cambridge", cfg["CAMBRIDGE_URL"], cfg["AUDIO_ACCENT"], word)
+    data, _ = FETCHES.do(key, lambda: _fetch_cambridge(cfg, word))
+    return dict(data) if data else data  # callers merge into it
+
+
+def _fetch_cambridge(cfg, word):
+    url = f"{cfg['CAMBRIDGE_URL']}{word.replace(' ', '-')}"
     headers = {"User-Agent": "Mozilla/5.0"}
     r = requests.get(url, headers=headers, timeout=10)
     if r.status_code != 200:
@@ -148,32 +298,51 @@ def fetch_cambridge(word):
         synonyms.append(syn.text.strip())
     synonyms = ", ".join(set(synonyms))
 
+    # Pronunciation MP3 (preferred accent first, then the other one)
+    audio_url = ""
+    accent_pref = cfg["AUDIO_ACCENT"]
+    for accent in (accent_pref, "us" if accent_pref == "uk" else "uk"):
+        source = soup.select_one(f".{accent}.dpron-i source[type='audio/mpeg']")
+        if source and source.get("src"):
+            audio_url = urljoin(r.url, source["src"])
+            break
+
     return {
         "ipa": ipa,
         "definition": definition,
         "examples": examples,
-        "synonyms": synonyms
+        "synonyms": synonyms,
+        "audio_url": audio_url
     }
 
 
 # ---------- Gemini (vocab/phrase) ----------
-def load_vocab_prompt(user_input: str, target_langs: list[str]) -> str:
-    prompt_path = VOCAB_PROMPT_FILE
+def vocab_template(cfg):
+    prompt_path = cfg["VOCAB_PROMPT_FILE"]
     if not prompt_path.is_absolute():
         prompt_path = Path.cwd() / prompt_path
-    base = prompt_path.read_text(encoding="utf-8")
-    return (base
-            .replace("{{INPUT}}", user_input)
-            .replace("{{TARGET_LANGS}}", ",".join(target_langs)))
+    return get_template(prompt_path, on_error=on_file_error)
 
 
-def call_vocab_gemini(prompt: str) -> str | None:
-    if not VOCAB_GEMINI_API_KEY:
+def load_vocab_prompt(cfg, user_input: str) -> str:
+    return vocab_template(cfg).render(INPUT=user_input, TARGET_LANGS=",".join(cfg["TARGET_LANGS"]))
+
+
+def call_vocab_gemini(cfg, prompt: str) -> str | None:
+    key = ("gemini", cfg["VOCAB_GEMINI_URL"], prompt)
+    text, _ = FETCHES.do(key, lambda: _call_vocab_gemini(cfg, prompt))
+    return text
+
+
+def _call_vocab_gemini(cfg, prompt: str) -> str | None:
+    api_key = cfg["VOCAB_GEMINI_API_KEY"]
+    url = cfg["VOCAB_GEMINI_URL"]
+    if not api_key:
         return None
 
     headers = {
         "Content-Type": "application/json",
-        "X-goog-api-key": VOCAB_GEMINI_API_KEY
+        "X-goog-api-key": api_key
     }
 
     payload = {
@@ -186,7 +355,26 @@ def call_vocab_gemini(prompt: str) -> str | None:
         ]
     }
 
-    r = requests.post(VOCAB_GEMINI_URL, headers=headers, json=payload, timeout=30)
+    # Send only the per-item tail when the static prefix is in Gemini's context cache
+    cached = None
+    if cfg["GEMINI_CONTEXT_CACHE"]:
+        prefix = vocab_template(cfg).static_prefix("INPUT", TARGET_LANGS=",".join(cfg["TARGET_LANGS"]))
+        if prefix and prompt.startswith(prefix):
+            cached = GEMINI_CACHE.cached_content(
+                "vocab", url, api_key, prefix, cfg["GEMINI_CACHE_TTL"],
+                log, cfg["GEMINI_CACHE_MIN_TOKENS"])
+
+    if cached:
+        r = requests.post(url, headers=headers, timeout=30, json={
+            "cachedContent": cached,
+            "contents": [{"role": "user", "parts": [{"text": prompt[len(prefix):]}]}]
+        })
+        if r.status_code in (400, 403, 404):
+            log(f"Gemini rejected cached content ({r.status_code}), sending full prompt", level="WARN")
+            GEMINI_CACHE.invalidate("vocab")
+            cached = None
+    if not cached:
+        r = requests.post(url, headers=headers, json=payload, timeout=30)
 
     if r.status_code == 429:
         log("Gemini rate limited (429), skipping", level="WARN")
@@ -269,15 +457,21 @@ def format_definition_with_translations(definition_en: str, translations: dict)
 
 
 # ---------- Bing Image Fetcher ----------
-def fetch_image_bing(search_query: str):
+def fetch_image_bing(cfg, search_query: str):
     """Return a list of candidate image URLs from Bing Images for `search_query`.
 
     This collects `murl` values from `a.iusc` JSON blobs and falls back to
     regex extraction. The caller should attempt downloads and retry.
     """
+    key = ("bing", cfg["BING_IMAGES_URL"], search_query)
+    urls, _ = FETCHES.do(key, lambda: _fetch_image_bing(cfg, search_query))
+    return list(urls)
+
+
+def _fetch_image_bing(cfg, search_query: str):
     query = requests.utils.quote(search_query)
     url = (
-        f"https://www.bing.com/images/search?"
+        f"{cfg['BING_IMAGES_URL']}?"
         f"q={query}&form=HDRSC2&mkt=en-US&setLang=en"
     )
 
@@ -333,7 +527,7 @@ def fetch_image_bing(search_query: str):
     return out
 
 
-def add_image_to_anki(word, image_urls, max_retries: int = 10):
+def add_image_to_anki(cfg, word, image_urls, max_retries: int = 10):
     """Try to download image(s) from `image_urls` and store the first valid
     image in Anki media. `image_urls` may be a single URL or an iterable.
 
@@ -356,44 +550,18 @@ def add_image_to_anki(word, image_urls, max_retries: int = 10):
         tried += 1
         log(f"Trying image #{tried}: {img_url}")
         try:
-            r = requests.get(img_url, headers=headers, timeout=10)
-            if r.status_code != 200:
-                log(f"Image URL returned status {r.status_code}", level="DEBUG")
-                continue
-
-            ctype = r.headers.get("Content-Type", "")
-            log(f"Image response content-type: {ctype}")
-            if not ctype.startswith("image") or not r.content:
-                log("Not an image or empty response", level="DEBUG")
-                continue
-
-            # Try to determine extension from URL path
-            path = urlparse(img_url).path
-            if path:
-                ext = unquote(path).split('.')[-1].split('?')[0]
-            else:
-                ext = ''
-
-            if not ext or '/' in ext or len(ext) > 5:
-                # derive from content-type
-                if "png" in ctype:
-                    ext = 'png'
-                elif "gif" in ctype:
-                    ext = 'gif'
-                else:
-                    ext = 'jpg'
+            content, ext = download_capped(img_url, headers, cfg["IMAGE_MAX_BYTES"])
+            log(f"Image downloaded: {ext}, {len(content)} bytes")
 
             filename = f"{hashlib.md5(word.encode()).hexdigest()}.{ext}"
-            b64 = base64.b64encode(r.content).decode('ascii')
-
-            anki("storeMediaFile", {
-                "filename": filename,
-                "data": b64
-            })
+            store_media(cfg, filename, content)
 
             log(f"Stored media as {filename}")
             return f'<img src="{filename}">'
 
+        except DownloadRejected as e:
+            log(f"Image rejected: {e}", level="DEBUG")
+            continue
         except Exception as e:
             log(f"Failed to download/store image: {e}", level="DEBUG")
             log_exception(e)
@@ -402,96 +570,462 @@ def add_image_to_anki(word, image_urls, max_retries: int = 10):
     log("No valid image found after retries", level="WARN")
     return ""
 
-# ---------- Hotkey ----------
-def on_hotkey():
+# ---------- Pronunciation audio ----------
+def add_audio_to_anki(cfg, word, audio_url, late_cambridge=None) -> str:
+    """Store the pronunciation MP3 for `word` in Anki media and return the
+    `[sound:...]` reference. Downloads are cached in AUDIO_CACHE_DIR by term
+    and AUDIO_ACCENT.
+
+    `late_cambridge` is the Cambridge lookup a hedge abandoned (see
+    hedged_lookup()); without `audio_url` it is given HEDGE_AUDIO_WAIT
+    seconds to deliver the URL.
+    """
+    filename = f"{hashlib.md5(word.encode()).hexdigest()}_{cfg['AUDIO_ACCENT']}.mp3"
+    cache_dir = cfg["AUDIO_CACHE_DIR"]
+    cache_path = cache_dir / filename
+
     try:
-        raw = pyperclip.paste().strip()
-        word = raw.lower()
-        word_count = len([p for p in word.split() if p.strip()])
+        if cache_path.exists():
+            content = cache_path.read_bytes()
+            log(f"Audio cache hit: {cache_path}")
+        else:
+            if not audio_url and late_cambridge is not None:
+                try:
+                    late, _, _ = late_cambridge.result(timeout=cfg["HEDGE_AUDIO_WAIT"])
+                except Exception:
+                    late = None  # still running, or cancelled before it started
+                audio_url = (late or {}).get("audio_url", "")
+            if not audio_url:
+                return ""
+            log(f"Downloading audio: {audio_url}")
+            try:
+                content, _ = download_capped(audio_url, {"User-Agent": "Mozilla/5.0"},
+                                             cfg["AUDIO_MAX_BYTES"], sniff=sniff_mp3)
+            except DownloadRejected as e:
+                log(f"Audio rejected: {e}", level="DEBUG")
+                return ""
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(".part")
+            tmp_path.write_bytes(content)
+            tmp_path.replace(cache_path)
+
+        store_media(cfg, filename, content)
+        log(f"Stored audio as {filename}")
+        return f"[sound:{filename}]"
+
+    except Exception as e:
+        log(f"Failed to download/store audio: {e}", level="WARN")
+        log_exception(e)
+        return ""
 
-        if not word or word_count > 30:
-            log("Clipboard không phải từ / phrase hợp lệ")
-            return
 
-        if note_exists(word):
-            log(f"Đã tồn tại: {word}")
+# ---------- Hedged Cambridge/Gemini lookup (hybrid) ----------
+_misses_lock = threading.Lock()
+_cambridge_misses = None
+
+
+def cambridge_missed_before(cfg, word: str) -> bool:
+    global _cambridge_misses
+    with _misses_lock:
+        if _cambridge_misses is None:
+            try:
+                _cambridge_misses = set(json.loads(cfg["HEDGE_MISS_FILE"].read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                _cambridge_misses = set()
+        return word in _cambridge_misses
+
+
+def record_cambridge_miss(cfg, word: str, missed: bool = True):
+    """Add `word` to the miss file, or drop it (`missed=False`) once
+    Cambridge has a definition again."""
+    cambridge_missed_before(cfg, word)  # make sure the file is loaded
+    with _misses_lock:
+        if (word in _cambridge_misses) == missed:
             return
+        if missed:
+            _cambridge_misses.add(word)
+        else:
+            _cambridge_misses.discard(word)
+        path = cfg["HEDGE_MISS_FILE"]
+        try:
+            path.write_text(json.dumps(sorted(_cambridge_misses), ensure_ascii=False), encoding="utf-8")
+        except OSError as e:
+            log(f"Could not save {path}: {e}", level="WARN")
+
+
+def gemini_vocab_lookup(cfg, raw: str):
+    prompt = load_vocab_prompt(cfg, raw)
+    gemini_text = call_vocab_gemini(cfg, prompt)
+    if gemini_text:
+        return parse_vocab_output(gemini_text, cfg["TARGET_LANGS"])
+    return None
+
+
+def _timed(fn, *args):
+    """Run `fn` and return (result, finished_at, failed)."""
+    try:
+        return fn(*args), time.monotonic(), False
+    except Exception as e:
+        log(f"{fn.__name__} failed: {e}", level="WARN")
+        return None, time.monotonic(), True
+
+
+def hedged_lookup(cfg, word: str, raw: str):
+    """Cambridge lookup that hedges with Gemini after HEDGE_DEADLINE seconds.
+
+    Returns (cambridge_data, gemini_payload, gemini_tried, late_cambridge).
+    The merge in create_vocab_card() still prefers Cambridge whenever its
+    answer is there; the call that is no longer needed is cancelled if it
+    hasn't started, or abandoned (its result ignored) if it is already on the
+    wire. An abandoned Cambridge call is returned as `late_cambridge` so the
+    audio stage can still take the pronunciation URL from it.
+    """
+    t0 = time.monotonic()
+    deadline = cfg["HEDGE_DEADLINE"]
+    cam = STAGE_POOL.submit(_timed, fetch_cambridge, cfg, word)
+
+    missed_before = cambridge_missed_before(cfg, word)
+    if missed_before:
+        log(f"Hedge: Cambridge missed '{word}' before, asking Gemini in parallel")
+    elif wait([cam], timeout=deadline).done:
+        data, _, failed = cam.result()
+        if not failed and (not data or not data.get("definition")):
+            record_cambridge_miss(cfg, word)
+        return data, None, False, None
+    else:
+        log(f"Hedge: Cambridge slower than {deadline}s, starting Gemini")
+
+    gem_started = time.monotonic()
+    gem = STAGE_POOL.submit(_timed, gemini_vocab_lookup, cfg, raw)
+
+    def cambridge_answer():
+        data, done_at, failed = cam.result()
+        if data and data.get("definition"):
+            record_cambridge_miss(cfg, word, missed=False)
+            return data
+        if not failed:
+            record_cambridge_miss(cfg, word)
+        return None
+
+    def drop(loser_future, loser):
+        """Cancel/abandon the losing call; log the time saved once it finishes."""
+        won_at = time.monotonic()
+
+        def done(f):
+            if f.cancelled():
+                log(f"Hedge: {loser} cancelled before it started")
+                return
+            result, done_at, failed = f.result()
+            if loser == "gemini":
+                # sequential hybrid never calls Gemini when Cambridge answers
+                log(f"Hedge: cambridge won after {won_at - t0:.2f}s; "
+                    f"abandoned gemini call took {done_at - gem_started:.2f}s")
+                return
+            sequential = done_at - t0
+            if failed or not result or not result.get("definition"):
+                if not failed:
+                    record_cambridge_miss(cfg, word)
+                sequential += won_at - gem_started
+            else:
+                record_cambridge_miss(cfg, word, missed=False)
+            log(f"Hedge: gemini won after {won_at - t0:.2f}s; sequential path "
+                f"would have taken {sequential:.2f}s (saved {sequential - (won_at - t0):.2f}s)")
+
+        if not loser_future.cancel():
+            log(f"Hedge: abandoning in-flight {loser} call")
+        loser_future.add_done_callback(done)
+
+    wait([cam, gem], return_when=FIRST_COMPLETED)
+
+    if cam.done():
+        data = cambridge_answer()
+        if data and not gem.done():
+            drop(gem, "gemini")
+            return data, None, True, None
+        payload = gem.result()[0]
+        log(f"Hedge: using {'both sources' if data else 'gemini'} after {time.monotonic() - t0:.2f}s")
+        return data, payload, True, None
+
+    payload = gem.result()[0]
+    if payload is None:
+        # Gemini failed or was rate limited: fall back to whatever Cambridge gives
+        return cambridge_answer(), None, True, None
+
+    if wait([cam], timeout=cfg["HEDGE_GRACE"]).done:
+        log(f"Hedge: both answered within {time.monotonic() - t0:.2f}s")
+        return cambridge_answer(), payload, True, None
+    drop(cam, "cambridge")
+    return None, payload, True, cam
+
+
+# ---------- Pipeline ----------
+def normalize_term(raw: str) -> tuple[str, int]:
+    word = raw.strip().lower()
+    return word, len([p for p in word.split() if p.strip()])
+
 
-        use_gemini = False
-        if VOCAB_SOURCE == "gemini":
-            use_gemini = True
-        elif VOCAB_SOURCE == "hybrid" and word_count > PHRASE_MAX_WORDS_CAMBRIDGE:
-            use_gemini = True
+def wants_gemini(cfg, word_count: int) -> bool:
+    if cfg["VOCAB_SOURCE"] == "gemini":
+        return True
+    return cfg["VOCAB_SOURCE"] == "hybrid" and word_count > cfg["PHRASE_MAX_WORDS_CAMBRIDGE"]
 
-        data = None
-        tags = []
 
-        if not use_gemini and VOCAB_SOURCE in ("cambridge", "hybrid"):
+def bing_query_for(image_query: str) -> str:
+    # Bias image search toward conceptual, photo-like images and away from text-heavy assets
+    return f"{image_query} -text -poster -dictionary -document -quote -typography"
+
+
+def prefetch_vocab(cfg, raw: str) -> dict:
+    """Read-only stages of the vocab pipeline, run speculatively on clipboard
+    change: duplicate check, then Cambridge and the default Bing image search.
+
+    The two fetches are left running as futures, so the hotkey job only ever
+    waits for the duplicate check; an unfinished fetch is joined through
+    FETCHES by the job's own call.
+    """
+    word, word_count = normalize_term(raw)
+    result = {"exists": note_exists(cfg, word)}
+    if result["exists"]:
+        return result
+    if not wants_gemini(cfg, word_count) and cfg["VOCAB_SOURCE"] in ("cambridge", "hybrid"):
+        result["cambridge"] = STAGE_POOL.submit(fetch_cambridge, cfg, word)
+    result["bing_query"] = bing_query_for(word)
+    result["candidates"] = STAGE_POOL.submit(fetch_image_bing, cfg, result["bing_query"])
+    return result
+
+
+# Letters, joined by single spaces, hyphens or apostrophes ("well-being", "o'clock")
+VOCAB_TERM_RE = re.compile(r"[^\W\d_]+(?:(?: |-|'|’)[^\W\d_]+)*")
+
+
+def looks_like_vocab_term(word: str, word_count: int, cfg) -> bool:
+    """Only clipboard text shaped like a short term is sent upstream
+    speculatively; passwords, URLs, e-mails and tokens are left alone."""
+    return (0 < word_count <= cfg["PHRASE_MAX_WORDS_CAMBRIDGE"] and len(word) <= 60
+            and VOCAB_TERM_RE.fullmatch(word) is not None)
+
+
+def on_clipboard_change(text: str):
+    cfg = refresh_config()
+    if not cfg["PREFETCH"]:
+        return
+    word, word_count = normalize_term(text)
+    if not looks_like_vocab_term(word, word_count, cfg):
+        return
+    if PREFETCH_CACHE.submit(word, lambda: prefetch_vocab(cfg, word), cfg["PREFETCH_TTL"]):
+        log("Prefetching copied term", level="DEBUG")
+
+
+def create_vocab_card(raw: str, cfg: dict | None = None) -> str:
+    """Run the full vocab pipeline for `raw` and add the note, with the
+    settings snapshot `cfg` (default: the current config).
+
+    Returns a short status: "added", "joined", "exists", "invalid",
+    "schema_error" or "no_data".
+    Exceptions are left to the caller (hotkey handler / bulk export).
+
+    Concurrent calls for the same normalized term share one run (and its
+    status), so a double hotkey press can't add the note twice. Callers that
+    joined a run which added the note get "joined", so only one counts it.
+    """
+    cfg = cfg or refresh_config()
+    raw = raw.strip()
+    word, word_count = normalize_term(raw)
+
+    if not word or word_count > 30:
+        log("Clipboard không phải từ / phrase hợp lệ")
+        return "invalid"
+
+    problems = check_schema(cfg)
+    if problems:
+        for problem in problems:
+            log(problem, level="ERROR")
+        return "schema_error"
+
+    status, shared = JOBS.do(("vocab", word), lambda: vocab_pipeline(cfg, raw, word, word_count))
+    if shared:
+        log(f"Joined in-flight job for: {word} ({status})")
+        if status == "added":
+            return "joined"
+    return status
+
+
+def vocab_pipeline(cfg, raw: str, word: str, word_count: int) -> str:
+    # results of read-only stages started when the text was copied (if any)
+    pre = PREFETCH_CACHE.take(word, timeout=2) if cfg["PREFETCH"] else None
+    if pre:
+        log(f"Using prefetched stages: {', '.join(pre)}")
+
+    exists = pre["exists"] if pre else note_exists(cfg, word)
+    if exists:
+        log(f"Đã tồn tại: {word}")
+        return "exists"
+
+    use_gemini = wants_gemini(cfg, word_count)
+    source = cfg["VOCAB_SOURCE"]
+
+    data = None
+    tags = []
+    gemini_payload = None
+    gemini_tried = False
+    late_cambridge = None
+
+    if not use_gemini and source in ("cambridge", "hybrid"):
+        prefetched = pre.get("cambridge") if pre else None
+        if prefetched and prefetched.done() and not prefetched.exception():
+            # a prefetch still on the wire is joined by the lookups below instead,
+            # so a slow Cambridge is hedged as usual
+            data = prefetched.result()
+        elif source == "hybrid" and cfg["HEDGE"] and cfg["VOCAB_GEMINI_API_KEY"]:
+            log(f"Đang crawl Cambridge (hedged): {word}")
+            data, gemini_payload, gemini_tried, late_cambridge = hedged_lookup(cfg, word, raw)
+        else:
             log(f"Đang crawl Cambridge: {word}")
-            data = fetch_cambridge(word)
-            tags.append("cambridge")
-
-        gemini_payload = None
-        if use_gemini or not data or not data.get("definition"):
-            log("Đang gọi Gemini cho vocab/phrase...")
-            prompt = load_vocab_prompt(raw, TARGET_LANGS)
-            gemini_text = call_vocab_gemini(prompt)
-            if gemini_text:
-                gemini_payload = parse_vocab_output(gemini_text, TARGET_LANGS)
-                tags.append("gemini")
-
-        if not data:
-            data = {"ipa": "", "definition": "", "examples": "", "synonyms": ""}
-
-        # Merge Gemini into Cambridge (prefer Cambridge IPA if present; prefer Cambridge definition if present)
-        if gemini_payload:
-            merged_definition_en = data.get("definition") or gemini_payload.get("definition_en", "")
-            merged_definition = format_definition_with_translations(
-                merged_definition_en,
-                gemini_payload.get("translations", {})
-            )
-            data["definition"] = merged_definition
-            if not data.get("ipa"):
-                data["ipa"] = gemini_payload.get("ipa", "")
-            if not data.get("examples"):
-                data["examples"] = gemini_payload.get("examples", "")
-            if not data.get("synonyms"):
-                data["synonyms"] = gemini_payload.get("synonyms", "")
-
-        if not data or not data["definition"]:
-            log("Không lấy được dữ liệu vocab")
-            return
-        
-        log(f"Đang tìm ảnh minh họa...")
-        image_query = word
-        if gemini_payload and gemini_payload.get("image_query"):
-            image_query = gemini_payload["image_query"]
-
-        # Bias image search toward conceptual, photo-like images and away from text-heavy assets
-        bing_query = f"{image_query} -text -poster -dictionary -document -quote -typography"
-
-        candidates = fetch_image_bing(bing_query)
-        image_html = ""
-
-        if candidates:
-            image_html = add_image_to_anki(word, candidates, max_retries=10)
-
-        log(f"IMAGE HTML: {image_html}")
-        add_note({
-            "word": word,
-            "image": image_html,
-            "tags": list(dict.fromkeys(["vocab"] + tags)),
-            **data
-        })
+            data = fetch_cambridge(cfg, word)
+        tags.append("cambridge")
+
+    if not gemini_tried and (use_gemini or not data or not data.get("definition")):
+        log("Đang gọi Gemini cho vocab/phrase...")
+        gemini_payload = gemini_vocab_lookup(cfg, raw)
+
+    if gemini_payload:
+        tags.append("gemini")
+
+    if not data:
+        data = {"ipa": "", "definition": "", "examples": "", "synonyms": ""}
+
+    # Merge Gemini into Cambridge (prefer Cambridge IPA if present; prefer Cambridge definition if present)
+    if gemini_payload:
+        merged_definition_en = data.get("definition") or gemini_payload.get("definition_en", "")
+        merged_definition = format_definition_with_translations(
+            merged_definition_en,
+            gemini_payload.get("translations", {})
+        )
+        data["definition"] = merged_definition
+        if not data.get("ipa"):
+            data["ipa"] = gemini_payload.get("ipa", "")
+        if not data.get("examples"):
+            data["examples"] = gemini_payload.get("examples", "")
+        if not data.get("synonyms"):
+            data["synonyms"] = gemini_payload.get("synonyms", "")
+
+    if not data or not data["definition"]:
+        log("Không lấy được dữ liệu vocab")
+        return "no_data"
+
+    # audio runs alongside the image search/download below
+    audio_future = None
+    if cfg["FETCH_AUDIO"]:
+        audio_future = STAGE_POOL.submit(add_audio_to_anki, cfg, word, data.get("audio_url", ""),
+                                         late_cambridge)
+
+    log(f"Đang tìm ảnh minh họa...")
+    image_query = word
+    if gemini_payload and gemini_payload.get("image_query"):
+        image_query = gemini_payload["image_query"]
+
+    bing_query = bing_query_for(image_query)
+
+    candidates = None
+    if pre and pre.get("bing_query") == bing_query:
+        try:
+            candidates = pre["candidates"].result()  # same wait as joining it
+        except Exception:
+            pass
+    if candidates is None:
+        candidates = fetch_image_bing(cfg, bing_query)
+    image_html = ""
+
+    if candidates:
+        image_html = add_image_to_anki(cfg, word, candidates, max_retries=10)
+
+    log(f"IMAGE HTML: {image_html}")
+    if audio_future:
+        data["audio"] = audio_future.result()
+
+    add_note(cfg, {
+        "word": word,
+        "image": image_html,
+        "tags": list(dict.fromkeys(["vocab"] + tags)),
+        **data
+    })
 
-        log(f"Đã add thật sự: {word}")
+    log(f"Đã add thật sự: {word}")
+    return "added"
 
+
+# ---------- Hotkey ----------
+def on_hotkey():
+    try:
+        cfg = refresh_config()
+        raw = pyperclip.paste()
+        with profile_job(f"vocab_{raw}", cfg["PROFILE_DIR"], PROFILE_OVERRIDE or cfg["PROFILE"], log):
+            create_vocab_card(raw, cfg)
     except Exception as e:
         log(f"Lỗi: {e}", level="ERROR")
         log_exception(e)
 
 
+# ---------- Bulk export ----------
+def export_apkg(terms_file: Path, out_path: Path, workers: int | None = None):
+    """Build cards for every line of `terms_file` into `out_path` (.apkg),
+    without AnkiConnect. Blank lines and `#` comments are skipped.
+    """
+    global APKG_WRITER
+
+    cfg = refresh_config()
+    workers = workers or cfg["APKG_WORKERS"]
+    terms = []
+    for line in terms_file.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            terms.append(line)
+
+    log(f"Exporting {len(terms)} terms to {out_path} ({workers} workers)")
+    counts = {}
+    started = time.monotonic()
+
+    def run(term):
+        try:
+            return create_vocab_card(term, cfg)
+        except Exception as e:
+            log(f"Lỗi [{term}]: {e}", level="ERROR")
+            return "failed"
+
+    with ApkgWriter(out_path) as writer:
+        APKG_WRITER = writer
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                for i, status in enumerate(pool.map(run, terms), start=1):
+                    counts[status] = counts.get(status, 0) + 1
+                    if i % 100 == 0:
+                        log(f"Progress: {i}/{len(terms)}")
+        finally:
+            APKG_WRITER = None
+
+    log(f"Export done in {time.monotonic() - started:.1f}s: {counts}")
+    return counts
+
+
 def main():
+    global PROFILE_OVERRIDE
+
+    parser = argparse.ArgumentParser(description="Auto Anki Vocab Helper")
+    parser.add_argument("--profile", metavar="MODE", nargs="?", const="all",
+                        help="profile hotkey jobs: 'all' (default) or a sampling fraction like 0.1")
+    parser.add_argument("--apkg", metavar="OUT.apkg", type=Path,
+                        help="write cards for TERMS_FILE into an .apkg instead of using AnkiConnect")
+    parser.add_argument("terms_file", nargs="?", type=Path,
+                        help="one term per line (used with --apkg)")
+    args = parser.parse_args()
+    PROFILE_OVERRIDE = args.profile
+
+    if args.apkg:
+        if not args.terms_file:
+            parser.error("--apkg requires TERMS_FILE")
+        export_apkg(args.terms_file, args.apkg)
+        return
+
     log("===================================")
     log("Auto Anki Vocab Helper")
     log(f"Hotkey: {HOTKEY}")
@@ -499,6 +1033,12 @@ def main():
     log("Close this window to stop")
     log("===================================")  
 
+    probe_anki(STARTUP)
+
+    if STARTUP["PREFETCH"]:
+        log("Prefetch: watching clipboard")
+        watch_clipboard(pyperclip.paste, on_clipboard_change, STARTUP["PREFETCH_INTERVAL"], log)
+
     keyboard.add_hotkey(HOTKEY, on_hotkey)
     keyboard.wait()
 